@@ -0,0 +1,95 @@
+# attachments.py
+import html
+import io
+import re
+import zipfile
+from dataclasses import dataclass
+
+from aiogram.types import BufferedInputFile
+
+# Telegram ограничивает подпись к файлу 1024 символами (после разбора HTML)
+CAPTION_LIMIT = 1024
+# Файлы больше этого размера (в байтах) отправляются архивом
+COMPRESS_THRESHOLD = 64 * 1024
+
+SUMMARY_MOVED_NOTE = "(не поместился в сообщение - см. начало файла)"
+
+_TAG_RE = re.compile(r'<[^>]+>')
+
+@dataclass(slots=True)
+class PreparedDocument:
+    """Вложение, готовое к отправке, и его размеры для статистики."""
+    file: BufferedInputFile
+    raw_size: int
+    uploaded_size: int
+    compressed: bool
+
+class UploadCounter:
+    """
+    Счетчик вложений, отправленных с момента запуска процесса. Учитываются только
+    успешно загруженные в Telegram файлы - из цикла, фоновых досылок и push-событий.
+    """
+    def __init__(self):
+        self.files = 0
+        self.compressed = 0
+        self.raw_bytes = 0
+        self.uploaded_bytes = 0
+
+    def add(self, document: PreparedDocument):
+        self.files += 1
+        self.compressed += int(document.compressed)
+        self.raw_bytes += document.raw_size
+        self.uploaded_bytes += document.uploaded_size
+
+    def totals(self) -> tuple[int, int, int, int]:
+        """Снимок счетчика (файлы, в архиве, исходные байты, загруженные байты) для подсчета разницы за цикл."""
+        return self.files, self.compressed, self.raw_bytes, self.uploaded_bytes
+
+upload_counter = UploadCounter()
+
+def visible_length(html_text: str) -> int:
+    """Длина подписи так, как ее считает Telegram: без HTML-тегов и с раскрытыми сущностями."""
+    return len(html.unescape(_TAG_RE.sub('', html_text)))
+
+def make_document(text: str, filename: str) -> PreparedDocument:
+    """Готовит текстовое вложение; большие файлы упаковываются в zip (его откроет любой телефон)."""
+    data = text.encode('utf-8')
+    compressed = len(data) > COMPRESS_THRESHOLD
+    if compressed:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(filename, data)
+        payload, filename = buffer.getvalue(), f"{filename.rsplit('.', 1)[0]}.zip"
+    else:
+        payload = data
+    return PreparedDocument(BufferedInputFile(file=payload, filename=filename), len(data), len(payload), compressed)
+
+def build_call_notification(template_text: str, call_data: dict) -> tuple[str, str | None, PreparedDocument]:
+    """
+    Собирает уведомление о звонке: подпись, режим разметки и файл с транскрибацией.
+    Если подпись не помещается в лимит Telegram, результат звонка переносится в файл,
+    а если не помогает и это - подпись отправляется обрезанным простым текстом.
+    KeyError из шаблона пробрасывается.
+    """
+    transcription_text = call_data['transcription_text']
+    caption = template_text.format(
+        call_time=call_data['call_time'],
+        audio_link=call_data['audio_link'],
+        summarizing_pretty=call_data['summarizing_pretty']
+    )
+    parse_mode = "HTML"
+
+    if visible_length(caption) > CAPTION_LIMIT:
+        caption = template_text.format(
+            call_time=call_data['call_time'],
+            audio_link=call_data['audio_link'],
+            summarizing_pretty=SUMMARY_MOVED_NOTE
+        )
+        transcription_text = f"Результат звонка:\n{call_data['summarizing_pretty']}\n\n{transcription_text}"
+
+    if visible_length(caption) > CAPTION_LIMIT:
+        plain_caption = html.unescape(_TAG_RE.sub('', caption))
+        caption, parse_mode = plain_caption[:CAPTION_LIMIT - 1] + "…", None
+
+    document = make_document(transcription_text, call_data['transcription_filename'])
+    return caption, parse_mode, document
@@ -0,0 +1,55 @@
+# benchmarks/bench_db_paths.py
+"""
+Сравнение запросов цикла планировщика: ORM (database/requests.py)
+против прямого asyncpg (database/fast_path.py).
+
+Запуск из корня проекта на рабочей или тестовой БД из .env:
+    python -m benchmarks.bench_db_paths [количество_циклов]
+
+Цикл = список активных конфигураций + активный шаблон + обновление отметки
+проверки для каждой конфигурации. Отметки перезаписываются их же текущими
+значениями, курсоры не трогаются, так что данные не меняются.
+"""
+import asyncio
+import sys
+import time
+
+from database import fast_path
+from database.requests import get_all_active_configs, get_active_template, update_config_check_time
+
+async def orm_cycle():
+    configs = await get_all_active_configs()
+    await get_active_template()
+    for config in configs:
+        await update_config_check_time(config.config_id, config.last_checked_at)
+    return len(configs)
+
+async def fast_cycle():
+    configs = await fast_path.fetch_active_configs()
+    await fast_path.fetch_active_template_text()
+    for config in configs:
+        await fast_path.update_config_check_time(config["config_id"], config["last_checked_at"])
+    return len(configs)
+
+async def measure(label: str, cycle, cycles: int):
+    # Прогрев: соединения в пулах и подготовленные выражения
+    configs_count = await cycle()
+    wall_started, cpu_started = time.perf_counter(), time.process_time()
+    for _ in range(cycles):
+        await cycle()
+    wall = (time.perf_counter() - wall_started) / cycles
+    cpu = (time.process_time() - cpu_started) / cycles
+    round_trips = configs_count + 2
+    print(f"{label:<8} цикл {wall * 1000:8.2f} мс, CPU {cpu * 1000:7.2f} мс, "
+          f"{wall / round_trips * 1000:6.2f} мс на запрос ({configs_count} конфигураций)")
+    return wall, cpu
+
+async def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    orm_wall, orm_cpu = await measure("ORM", orm_cycle, cycles)
+    fast_wall, fast_cpu = await measure("asyncpg", fast_cycle, cycles)
+    print(f"asyncpg быстрее в x{orm_wall / fast_wall:.2f} по времени цикла и в x{orm_cpu / fast_cpu:.2f} по CPU")
+    await fast_path.close_pool()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+# benchmarks/bench_json_decode.py
+"""
+Микробенчмарк разбора страниц звонков: стандартный json против orjson.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_json_decode [записанная_страница.json ...]
+
+Без аргументов разбирается синтетическая страница из LIMIT звонков с длинными
+диалогами, где variables и summarizing закодированы строками, как их отдает платформа.
+Записанную страницу можно сохранить из ответа API как есть (сырые байты).
+"""
+import datetime
+import json
+import sys
+import timeit
+
+import json_backend
+from platform_api import LIMIT, parse_calls
+
+ROUNDS = 20
+
+def make_synthetic_page(calls: int = LIMIT, dialog_turns: int = 120) -> bytes:
+    started = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    page = []
+    for i in range(calls):
+        dialog = []
+        for turn in range(dialog_turns):
+            if turn % 2:
+                dialog.append({"assistant": {"state": "active", "message": f"Ответ ассистента номер {turn}. " * 4}})
+            else:
+                dialog.append({"user": f"Реплика клиента номер {turn}, довольно длинная фраза. " * 3})
+        summarizing = {"result": "Заинтересован" if i % 3 else "Отказ", "comment": "Клиент просил перезвонить. " * 10}
+        variables = {
+            "all_audio_record": f"record_{i}.mp3",
+            "summarizing": json.dumps(summarizing, ensure_ascii=False),
+            "dialog": dialog,
+        }
+        call_time = (started + datetime.timedelta(minutes=i)).isoformat()
+        page.append({
+            "id": i + 1,
+            "uuid": f"uuid-{i}",
+            "storage": "s1",
+            "created_at": call_time,
+            "updated_at": call_time,
+            "variables": json.dumps(variables, ensure_ascii=False),
+        })
+    return json.dumps({"status": "success", "data": {"data": page}}, ensure_ascii=False).encode('utf-8')
+
+def parse_page(raw: bytes):
+    response_data = json_backend.loads(raw)
+    cursor_key = (datetime.datetime.min.replace(tzinfo=datetime.timezone.utc), -1)
+    return parse_calls(response_data["data"]["data"], cursor_key)
+
+def bench(raw: bytes):
+    results = {}
+    for backend in ("json", "orjson"):
+        json_backend.use_backend(backend)
+        if json_backend.BACKEND != backend:
+            print(f"  {backend}: не установлен, пропущено")
+            continue
+        decode_only = min(timeit.repeat(lambda: json_backend.loads(raw), number=1, repeat=ROUNDS))
+        seconds = min(timeit.repeat(lambda: parse_page(raw), number=1, repeat=ROUNDS))
+        results[backend] = seconds
+        print(f"  {backend:<7} {seconds * 1000:8.2f} мс на страницу (из них декодирование ответа {decode_only * 1000:.2f} мс)")
+    if len(results) == 2:
+        print(f"  ускорение: x{results['json'] / results['orjson']:.2f}")
+
+def main():
+    pages = [(path, open(path, 'rb').read()) for path in sys.argv[1:]]
+    if not pages:
+        pages = [("синтетическая страница", make_synthetic_page())]
+    for label, raw in pages:
+        print(f"{label}: {len(raw) / 1024:.0f} КБ")
+        bench(raw)
+
+if __name__ == "__main__":
+    main()
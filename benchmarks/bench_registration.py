@@ -0,0 +1,100 @@
+# benchmarks/bench_registration.py
+"""
+Нагрузочный тест регистрации: всплеск одновременных /start + ввода номера,
+как после рассылки. Проверяет разбор номера и add_user под конкуренцией.
+
+Запуск из корня проекта на тестовой БД из .env:
+    python -m benchmarks.bench_registration [пользователей] [одновременно]
+
+Пользователи создаются с отрицательными telegram_id (у настоящих пользователей
+Telegram id всегда положительный) и номерами +7999..., после замера удаляются. Часть запросов - повторы того же пользователя
+и чужого номера, чтобы нагрузить ветки user_exists / phone_exists.
+"""
+import asyncio
+import random
+import sys
+import time
+from collections import Counter
+
+from sqlalchemy import delete
+
+from database.models import async_session, User
+from database.requests import add_user
+from phones import parse_russian_phone
+
+# Синтетические id идут вниз от -1 и не пересекаются с настоящими пользователями
+SYNTHETIC_ID_BASE = -1
+# Доля повторных отправок (двойное нажатие, чужой номер)
+DUPLICATE_SHARE = 0.1
+# Форматы, в которых пользователи вводят номер
+PHONE_FORMATS = ("+7999{:07d}", "+7 999 {:07d}", "8999{:07d}", "7999{:07d}")
+
+def build_attempts(users: int) -> list[tuple[int, str]]:
+    attempts = [
+        (SYNTHETIC_ID_BASE - i, random.choice(PHONE_FORMATS).format(i))
+        for i in range(users)
+    ]
+    for _ in range(int(users * DUPLICATE_SHARE)):
+        tg_id, phone = random.choice(attempts)
+        if random.random() < 0.5:
+            attempts.append((tg_id, phone))
+        else:
+            attempts.append((tg_id - users, phone))
+    random.shuffle(attempts)
+    return attempts
+
+async def register(tg_id: int, raw_phone: str, limit: asyncio.Semaphore) -> tuple[str, float]:
+    async with limit:
+        started = time.perf_counter()
+        try:
+            result = await add_user(tg_id, parse_russian_phone(raw_phone))
+        except ValueError:
+            result = "invalid_phone"
+        return result, time.perf_counter() - started
+
+async def cleanup(users: int):
+    async with async_session() as session:
+        await session.execute(delete(User).where(
+            User.telegram_id.between(SYNTHETIC_ID_BASE - 2 * users, SYNTHETIC_ID_BASE)
+        ))
+        await session.commit()
+
+def measure_parsing(attempts: list[tuple[int, str]]):
+    started = time.perf_counter()
+    for _, raw_phone in attempts:
+        try:
+            parse_russian_phone(raw_phone)
+        except ValueError:
+            pass
+    per_call = (time.perf_counter() - started) / len(attempts)
+    canonical = sum(raw_phone.replace(" ", "").startswith("+7") for _, raw_phone in attempts)
+    print(f"Разбор номера: {per_call * 1e6:.1f} мкс в среднем, {canonical} из {len(attempts)} по быстрому пути")
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    attempts = build_attempts(users)
+    # Первый вызов загружает метаданные phonenumbers - в замер не включаем
+    parse_russian_phone("8 999 000-00-00")
+    measure_parsing(attempts)
+
+    await cleanup(users)
+    limit = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+    try:
+        results = await asyncio.gather(*(register(tg_id, phone, limit) for tg_id, phone in attempts))
+    finally:
+        wall = time.perf_counter() - started
+        await cleanup(users)
+
+    latencies = sorted(latency for _, latency in results)
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    print(f"{len(attempts)} регистраций, {concurrency} одновременно: {wall:.2f} с, "
+          f"{len(attempts) / wall:.0f} рег/с")
+    print(f"Задержка add_user: p50 {percentile(0.5):.1f} мс, p95 {percentile(0.95):.1f} мс, "
+          f"p99 {percentile(0.99):.1f} мс")
+    print(f"Результаты: {dict(Counter(result for result, _ in results))}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
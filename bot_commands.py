@@ -8,24 +8,36 @@ from config import ADMIN_IDS
 # --- Команды для обычных пользователей ---
 user_commands = [
     BotCommand(command="start", description="🔄 Перезапустить / Обновить меню"),
-    BotCommand(command="help", description="ℹ️ Справка по работе с ботом")
+    BotCommand(command="help", description="ℹ️ Справка по работе с ботом"),
+    BotCommand(command="stats", description="📊 Статистика звонков")
 ]
 
 # --- Команды для администраторов (включают все команды пользователей) ---
 admin_commands = user_commands + [
     BotCommand(command="admin", description="🔒 Админ-панель"),
     BotCommand(command="list_users", description="👥 Список пользователей"),
+    BotCommand(command="stats_all", description="📊 Статистика по всем пользователям"),
     BotCommand(command="assign", description="📎 Назначить данные пользователю"),
+    BotCommand(command="import_configs", description="📥 Массовый импорт данных из CSV"),
     BotCommand(command="get_template", description="📄 Показать текущий шаблон"),
     BotCommand(command="edit_template", description="✏️ Редактировать шаблон"),
-    BotCommand(command="export_gsheet", description="📈 Экспорт в Google Sheets")
+    BotCommand(command="export_gsheet", description="📈 Экспорт в Google Sheets"),
+    BotCommand(command="profile", description="⏱ Профилировать циклы планировщика")
 ]
 
+# Какой набор команд последним отправлен в каждый чат. Повторные /start и /admin
+# не должны каждый раз ходить в Bot API, если меню уже установлено.
+_pushed_scopes: dict[int, str] = {}
+
 # --- Функция для установки команд ---
 async def set_user_commands(bot: Bot, chat_id: int):
     """
     Устанавливает меню команд в зависимости от роли пользователя.
     """
-    commands = admin_commands if chat_id in ADMIN_IDS else user_commands
+    scope_name = "admin" if chat_id in ADMIN_IDS else "user"
+    if _pushed_scopes.get(chat_id) == scope_name:
+        return
+    commands = admin_commands if scope_name == "admin" else user_commands
     # Устанавливаем команды для конкретного чата
-    await bot.set_my_commands(commands=commands, scope=BotCommandScopeChat(chat_id=chat_id))
\ No newline at end of file
+    await bot.set_my_commands(commands=commands, scope=BotCommandScopeChat(chat_id=chat_id))
+    _pushed_scopes[chat_id] = scope_name
\ No newline at end of file
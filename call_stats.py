@@ -0,0 +1,36 @@
+# call_stats.py
+import datetime
+import html
+from collections import Counter
+
+# За сколько дней показывается статистика в /stats
+STATS_DAYS = 7
+
+def stats_period_start(today: datetime.date) -> datetime.date:
+    return today - datetime.timedelta(days=STATS_DAYS - 1)
+
+def render_stats(title: str, rows, today: datetime.date) -> str:
+    """
+    Формирует HTML-текст статистики из строк дневных агрегатов (day, outcome, calls_count).
+    """
+    by_day = Counter()
+    by_outcome = Counter()
+    for row in rows:
+        by_day[row.day] += row.calls_count
+        by_outcome[row.outcome] += row.calls_count
+
+    parts = [
+        f"<b>{title}</b>\n",
+        f"Сегодня: <b>{by_day[today]}</b>",
+        f"За {STATS_DAYS} дн.: <b>{sum(by_day.values())}</b>\n",
+        "<b>По дням:</b>",
+    ]
+    for offset in range(STATS_DAYS):
+        day = today - datetime.timedelta(days=offset)
+        parts.append(f"  {day.strftime('%d.%m')} - {by_day[day]}")
+
+    if by_outcome:
+        parts.append("\n<b>По результатам:</b>")
+        for outcome, count in by_outcome.most_common():
+            parts.append(f"  {html.escape(outcome)} - {count}")
+    return "\n".join(parts)
@@ -11,6 +11,31 @@ ADMIN_IDS = [int(admin_id) for admin_id in ADMIN_IDS_STR.split(',') if admin_id]
 
 GSHEET_NAME = os.getenv("GSHEET_NAME")
 
+# --- Статистика звонков ---
+# Поле итогового JSON (summarizing), по которому звонки группируются в /stats
+STATS_OUTCOME_FIELD = os.getenv("STATS_OUTCOME_FIELD", "result")
+# Часовой пояс, в котором считаются сутки для дневной статистики
+STATS_TIMEZONE = os.getenv("STATS_TIMEZONE", "Europe/Moscow")
+
+# --- Опрос платформы и push-события ---
+# Интервал опроса платформы, в минутах
+POLL_INTERVAL_MINUTES = int(os.getenv("POLL_INTERVAL_MINUTES", "3"))
+# Общий секрет для push-событий. Если задан, поднимается HTTP-endpoint, а опрос
+# становится редкой сверкой с интервалом RECONCILE_INTERVAL_MINUTES
+PUSH_SECRET = os.getenv("PUSH_SECRET")
+PUSH_HOST = os.getenv("PUSH_HOST", "127.0.0.1")
+PUSH_PORT = int(os.getenv("PUSH_PORT", "8081"))
+RECONCILE_INTERVAL_MINUTES = int(os.getenv("RECONCILE_INTERVAL_MINUTES", "30"))
+
+# Профилировать первые N циклов планировщика после старта (0 - выключено)
+PROFILE_CYCLES = int(os.getenv("PROFILE_CYCLES", "0"))
+
+# --- Разбор ответов платформы в пуле процессов ---
+# Число процессов (0 - пул выключен, все страницы разбираются в event loop)
+PARSE_POOL_WORKERS = int(os.getenv("PARSE_POOL_WORKERS", "0"))
+# Страницы меньше этого размера (в байтах) разбираются на месте, чтобы не платить за IPC
+PARSE_OFFLOAD_THRESHOLD = int(os.getenv("PARSE_OFFLOAD_THRESHOLD", str(512 * 1024)))
+
 # --- Читаем настройки БД из .env ---
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
@@ -19,4 +44,24 @@ DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 
 # Собираем строку подключения (DSN) для PostgreSQL
-DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
\ No newline at end of file
+DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# --- Необязательная реплика для чтения (админские списки, экспорт, статистика) ---
+# Если DB_REPLICA_HOST не задан, все запросы идут в основную БД.
+# Остальные параметры по умолчанию берутся от основной БД, так что для проверки
+# достаточно второго экземпляра PostgreSQL (другой порт) или второй базы (DB_REPLICA_NAME).
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST")
+DB_REPLICA_PORT = os.getenv("DB_REPLICA_PORT", DB_PORT)
+DB_REPLICA_NAME = os.getenv("DB_REPLICA_NAME", DB_NAME)
+DB_REPLICA_USER = os.getenv("DB_REPLICA_USER", DB_USER)
+DB_REPLICA_PASSWORD = os.getenv("DB_REPLICA_PASSWORD", DB_PASSWORD)
+# Максимально допустимое отставание реплики в секундах, при большем читаем с основной БД
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "30"))
+
+REPLICA_DATABASE_URL = (
+    f"postgresql+asyncpg://{DB_REPLICA_USER}:{DB_REPLICA_PASSWORD}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_REPLICA_NAME}"
+    if DB_REPLICA_HOST else None
+)
+
+# DSN для прямых подключений asyncpg (LISTEN/NOTIFY), без драйвера SQLAlchemy
+PG_DSN = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
\ No newline at end of file
@@ -0,0 +1,80 @@
+# csv_import.py
+import csv
+import io
+import logging
+
+from database.requests import get_existing_phones, get_existing_config_keys, add_user_configs_bulk
+from phones import parse_russian_phone
+
+logger = logging.getLogger(__name__)
+
+CSV_COLUMNS = ("phone", "bot_id", "api_key", "trunk_id")
+
+def _detect_dialect(sample: str):
+    """Excel с русской локалью сохраняет CSV через ';', поэтому разделитель определяем по образцу."""
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        return csv.excel
+
+# --- Основная функция импорта ---
+async def import_configs_from_csv(file: io.BytesIO) -> tuple[int, list[str]]:
+    """
+    Импортирует конфигурации из CSV со столбцами phone, bot_id, api_key, trunk_id.
+    Файл проверяется за один проход, номера проверяются одним запросом,
+    а все корректные строки добавляются одним executemany.
+    Возвращает кортеж (количество добавленных строк, список ошибок по строкам).
+    """
+    text_stream = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    sample = text_stream.read(4096)
+    text_stream.seek(0)
+    reader = csv.reader(text_stream, _detect_dialect(sample))
+
+    errors = [] # (номер строки, описание ошибки)
+    candidates = [] # (номер строки, словарь со значениями)
+    seen_keys = set()
+
+    for line_no, row in enumerate(reader, start=1):
+        if not any(cell.strip() for cell in row):
+            continue
+        # Строка заголовка необязательна
+        if line_no == 1 and row[0].strip().lower() == "phone":
+            continue
+        if len(row) != len(CSV_COLUMNS):
+            errors.append((line_no, f"ожидалось {len(CSV_COLUMNS)} столбца, получено {len(row)}."))
+            continue
+
+        phone, bot_id, api_key, trunk_id = (cell.strip() for cell in row)
+        if not (phone and bot_id and api_key and trunk_id):
+            errors.append((line_no, "пустое значение."))
+            continue
+        # Номер приводим к E.164 так же, как при регистрации, иначе 8916... не совпадет с +7916...
+        try:
+            phone = parse_russian_phone(phone)
+        except ValueError:
+            errors.append((line_no, f"некорректный номер телефона {phone}."))
+            continue
+
+        key = (bot_id, trunk_id, api_key)
+        if key in seen_keys:
+            errors.append((line_no, f"повтор связки bot_id={bot_id}, trunk_id={trunk_id} в файле."))
+            continue
+        seen_keys.add(key)
+        candidates.append((line_no, {"user_phone": phone, "bot_id": bot_id, "api_key": api_key, "trunk_id": trunk_id}))
+
+    # Номера и уже существующие связки проверяем сразу для всего файла
+    known_phones = await get_existing_phones(row["user_phone"] for _, row in candidates)
+    existing_keys = await get_existing_config_keys(row["bot_id"] for _, row in candidates)
+
+    rows_to_insert = []
+    for line_no, row in candidates:
+        if row["user_phone"] not in known_phones:
+            errors.append((line_no, f"пользователь с номером {row['user_phone']} не найден."))
+        elif (row["bot_id"], row["trunk_id"], row["api_key"]) in existing_keys:
+            errors.append((line_no, f"связка bot_id={row['bot_id']}, trunk_id={row['trunk_id']} уже назначена."))
+        else:
+            rows_to_insert.append(row)
+
+    added = await add_user_configs_bulk(rows_to_insert)
+    logger.info(f"Импорт конфигураций из CSV: добавлено {added}, ошибок {len(errors)}.")
+    return added, [f"Строка {line_no}: {error}" for line_no, error in sorted(errors)]
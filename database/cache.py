@@ -0,0 +1,45 @@
+# database/cache.py
+
+import time
+from collections import OrderedDict
+
+# Маркер промаха: None - допустимое закэшированное значение ("пользователь не найден")
+MISSING = object()
+
+class TTLCache:
+    """
+    Небольшой LRU-кэш с ограничением времени жизни записей.
+    Рассчитан на один процесс и один event loop, блокировки не нужны.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key, MISSING)
+        if item is MISSING:
+            return MISSING
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+# Кэши функций чтения из database/requests.py
+users_by_id = TTLCache()
+users_by_phone = TTLCache()
+users_by_config = TTLCache()
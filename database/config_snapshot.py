@@ -0,0 +1,184 @@
+# database/config_snapshot.py
+
+import asyncio
+import datetime
+import logging
+import time
+from dataclasses import dataclass
+
+import asyncpg
+
+from config import PG_DSN
+from .models import CONFIGS_CHANNEL
+from .fast_path import fetch_active_configs
+
+logger = logging.getLogger(__name__)
+
+# Полная перезагрузка снимка на случай потерянных уведомлений
+FULL_RELOAD_INTERVAL = 600
+# Если LISTEN-соединение недоступно, перечитываем конфигурации чаще
+FALLBACK_RELOAD_INTERVAL = 60
+# Таймаут подключения LISTEN-соединения и пауза перед новой попыткой после ошибки, в секундах
+LISTEN_CONNECT_TIMEOUT = 5
+LISTEN_RETRY_AFTER = 30
+
+@dataclass(slots=True)
+class ActiveConfig:
+    """Активная конфигурация в снимке планировщика. Курсор опроса обновляется на месте."""
+    config_id: int
+    telegram_id: int
+    api_key: str
+    bot_id: str
+    trunk_id: str
+    last_checked_at: datetime.datetime | None
+    cursor_updated_at: datetime.datetime | None
+    cursor_call_id: int | None
+    scanned_through: datetime.datetime | None = None
+
+    def cursor_key(self):
+        if self.cursor_updated_at is None:
+            return None
+        return (self.cursor_updated_at, self.cursor_call_id if self.cursor_call_id is not None else -1)
+
+    def scan_from(self) -> datetime.datetime | None:
+        """Нижняя граница следующего опроса: курсор или отметка просмотра, что новее."""
+        bounds = [bound for bound in (self.cursor_updated_at, self.scanned_through) if bound is not None]
+        return max(bounds) if bounds else None
+
+    def apply_check(self, check_time: datetime.datetime, cursor, scanned_through):
+        """Применяет результат опроса, никогда не откатывая курсор и отметку просмотра назад."""
+        if check_time is not None and (self.last_checked_at is None or check_time > self.last_checked_at):
+            self.last_checked_at = check_time
+        if cursor is not None and (self.cursor_key() is None or cursor > self.cursor_key()):
+            self.cursor_updated_at, self.cursor_call_id = cursor
+        if scanned_through is not None and (self.scanned_through is None or scanned_through > self.scanned_through):
+            self.scanned_through = scanned_through
+
+class ConfigSnapshot:
+    """
+    Снимок активных конфигураций, сгруппированных по api_key.
+    Обновляется по PostgreSQL LISTEN/NOTIFY и периодически перечитывается целиком,
+    так что цикл планировщика обычно начинается без JOIN-запроса к БД.
+    """
+    def __init__(self):
+        self.by_api_key: dict[str, list[ActiveConfig]] = {}
+        self._by_id: dict[int, ActiveConfig] = {}
+        self._by_bot_id: dict[str, list[ActiveConfig]] = {}
+        self._loaded_at = 0.0
+        self._dirty = True
+        self._listener = None
+        self._listener_lock = asyncio.Lock()
+        self._listener_retry_at = 0.0
+        self._reload_lock = asyncio.Lock()
+        self._reload_tasks = set()
+
+    async def get(self) -> dict[str, list[ActiveConfig]]:
+        await self._ensure_listener()
+        reload_interval = FULL_RELOAD_INTERVAL if self._listener is not None else FALLBACK_RELOAD_INTERVAL
+        if self._dirty or time.monotonic() - self._loaded_at > reload_interval:
+            await self.reload()
+        return self.by_api_key
+
+    def record_check(self, config: ActiveConfig, check_time: datetime.datetime, cursor, scanned_through):
+        """
+        Сохраняет результат опроса в объекте, с которым работал цикл, и в актуальном
+        объекте снимка: перезагрузка по NOTIFY могла заменить его, пока шел цикл.
+        """
+        config.apply_check(check_time, cursor, scanned_through)
+        current = self._by_id.get(config.config_id)
+        if current is not None and current is not config:
+            current.apply_check(check_time, cursor, scanned_through)
+
+    async def find_configs(self, bot_id: str, trunk_id: str | None = None,
+                           api_key: str | None = None) -> list[ActiveConfig]:
+        """
+        Конфигурации по связке bot_id + trunk_id + api_key, как в find_user_by_config.
+        trunk_id и api_key проверяются, только если переданы. Поиск идет по снимку в памяти.
+        """
+        await self.get()
+        return [
+            config for config in self._by_bot_id.get(bot_id, [])
+            if (trunk_id is None or config.trunk_id == trunk_id)
+            and (api_key is None or config.api_key == api_key)
+        ]
+
+    async def reload(self):
+        async with self._reload_lock:
+            # Сбрасываем флаг до запроса: NOTIFY, пришедший во время чтения, вызовет еще одну перезагрузку
+            self._dirty = False
+            rows = await fetch_active_configs()
+
+            by_api_key, by_id, by_bot_id = {}, {}, {}
+            for row in rows:
+                # Записи asyncpg доступны по имени колонки
+                config = ActiveConfig(
+                    config_id=row["config_id"],
+                    telegram_id=row["telegram_id"],
+                    api_key=row["api_key"],
+                    bot_id=row["bot_id"],
+                    trunk_id=row["trunk_id"],
+                    last_checked_at=row["last_checked_at"],
+                    cursor_updated_at=row["cursor_updated_at"],
+                    cursor_call_id=row["cursor_call_id"],
+                    scanned_through=row["scanned_through"]
+                )
+                # Курсор в памяти может быть новее прочитанного, если планировщик
+                # сдвинул его, пока шел запрос - назад его не откатываем
+                previous = self._by_id.get(config.config_id)
+                if previous is not None:
+                    config.apply_check(previous.last_checked_at, previous.cursor_key(), previous.scanned_through)
+                by_id[config.config_id] = config
+                by_api_key.setdefault(config.api_key, []).append(config)
+                by_bot_id.setdefault(config.bot_id, []).append(config)
+
+            self.by_api_key, self._by_id, self._by_bot_id = by_api_key, by_id, by_bot_id
+            self._loaded_at = time.monotonic()
+            logger.debug(f"Снимок конфигураций перечитан: {len(by_id)} конфигураций, {len(by_api_key)} api_key.")
+
+    def _listener_alive(self) -> bool:
+        return self._listener is not None and not self._listener.is_closed()
+
+    async def _ensure_listener(self):
+        if self._listener_alive() or time.monotonic() < self._listener_retry_at:
+            return
+        # get() вызывается и из цикла, и из параллельных push-запросов: подключаемся один раз
+        async with self._listener_lock:
+            if self._listener_alive() or time.monotonic() < self._listener_retry_at:
+                return
+            self._listener = None
+            connection = None
+            try:
+                connection = await asyncpg.connect(PG_DSN, timeout=LISTEN_CONNECT_TIMEOUT)
+                await connection.add_listener(CONFIGS_CHANNEL, self._on_notify)
+                connection.add_termination_listener(self._on_listener_closed)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+                if connection is not None:
+                    connection.terminate()
+                self._listener_retry_at = time.monotonic() + LISTEN_RETRY_AFTER
+                logger.warning(f"Не удалось подписаться на {CONFIGS_CHANNEL}, работаем на периодических перезагрузках: {e}")
+                return
+            self._listener = connection
+        # Пока слушателя не было, изменения могли быть пропущены
+        self._dirty = True
+        logger.info(f"Снимок конфигураций подписан на канал {CONFIGS_CHANNEL}.")
+
+    def _on_notify(self, connection, pid, channel, payload):
+        logger.info(f"Получено уведомление об изменении конфигураций ({payload}), перечитываем снимок.")
+        self._dirty = True
+        task = asyncio.get_running_loop().create_task(self._reload_in_background())
+        self._reload_tasks.add(task)
+        task.add_done_callback(self._reload_tasks.discard)
+
+    async def _reload_in_background(self):
+        try:
+            await self.reload()
+        except Exception:
+            logger.exception("Не удалось перечитать снимок конфигураций по уведомлению:")
+            self._dirty = True
+
+    def _on_listener_closed(self, connection):
+        logger.warning(f"LISTEN-соединение для {CONFIGS_CHANNEL} закрыто, переподключимся в следующем цикле.")
+        self._listener = None
+        self._dirty = True
+
+config_snapshot = ConfigSnapshot()
@@ -0,0 +1,67 @@
+# database/fast_path.py
+
+# Быстрый путь для запросов, которые планировщик выполняет каждый цикл.
+# Работает напрямую через пул asyncpg: без сессии SQLAlchemy, ORM-объектов
+# и отдельной транзакции на вызов. asyncpg сам готовит (PREPARE) и кэширует
+# выражения на каждом соединении, поэтому повторные вызовы идут без разбора SQL.
+# Все административные CRUD-операции остаются в database/requests.py на ORM.
+
+import datetime
+
+import asyncpg
+
+from config import PG_DSN
+
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 5
+
+ACTIVE_CONFIGS_SQL = """
+    SELECT uc.id AS config_id, u.telegram_id, uc.api_key, uc.bot_id, uc.trunk_id,
+           uc.last_checked_at, uc.cursor_updated_at, uc.cursor_call_id, uc.scanned_through
+    FROM users u
+    JOIN user_configs uc ON u.phone_number = uc.user_phone
+"""
+
+ACTIVE_TEMPLATE_SQL = "SELECT template_text FROM notification_templates WHERE is_active LIMIT 1"
+
+# NULL в курсоре или отметке просмотра означает "не менять"
+UPDATE_CHECK_SQL = """
+    UPDATE user_configs
+    SET last_checked_at = $2,
+        cursor_updated_at = COALESCE($3, cursor_updated_at),
+        cursor_call_id = COALESCE($4, cursor_call_id),
+        scanned_through = COALESCE($5, scanned_through)
+    WHERE id = $1
+"""
+
+_pool: asyncpg.Pool | None = None
+
+async def get_pool() -> asyncpg.Pool:
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(PG_DSN, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE)
+    return _pool
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+async def fetch_active_configs() -> list[asyncpg.Record]:
+    """Все активные конфигурации с telegram_id пользователя и курсором опроса."""
+    pool = await get_pool()
+    return await pool.fetch(ACTIVE_CONFIGS_SQL)
+
+async def fetch_active_template_text() -> str | None:
+    """Текст активного шаблона или None, если шаблон не установлен."""
+    pool = await get_pool()
+    return await pool.fetchval(ACTIVE_TEMPLATE_SQL)
+
+async def update_config_check_time(config_id: int, check_time: datetime.datetime,
+                                   cursor: tuple[datetime.datetime, int] | None = None,
+                                   scanned_through: datetime.datetime | None = None):
+    """То же, что database.requests.update_config_check_time, одним запросом в автокоммите."""
+    pool = await get_pool()
+    cursor_updated_at, cursor_call_id = cursor if cursor is not None else (None, None)
+    await pool.execute(UPDATE_CHECK_SQL, config_id, check_time, cursor_updated_at, cursor_call_id, scanned_through)
@@ -1,15 +1,34 @@
 # database/models.py
-from sqlalchemy import BigInteger, String, func, Boolean, Text, ForeignKey
+from sqlalchemy import BigInteger, String, func, Boolean, Text, ForeignKey, Integer, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
-from sqlalchemy.types import DateTime
+from sqlalchemy.types import DateTime, Date
 import datetime
-from config import DATABASE_URL
+from config import DATABASE_URL, REPLICA_DATABASE_URL
 
 # Заменяем создание движка на новое, для PostgreSQL
 engine = create_async_engine(DATABASE_URL)
 async_session = async_sessionmaker(engine)
 
+# Необязательная реплика для тяжелых чтений: свой движок и свой пул соединений,
+# чтобы экспорт и админские списки не занимали соединения основной БД.
+# Все транзакции на реплике открываются как READ ONLY
+if REPLICA_DATABASE_URL:
+    replica_engine = create_async_engine(
+        REPLICA_DATABASE_URL,
+        pool_size=3,
+        max_overflow=2,
+        execution_options={"postgresql_readonly": True}
+    )
+    async_read_session = async_sessionmaker(replica_engine)
+else:
+    replica_engine = None
+    async_read_session = None
+
+# Канал PostgreSQL NOTIFY, в который сообщается об изменении конфигураций
+CONFIGS_CHANNEL = "user_configs_changed"
+
 class Base(AsyncAttrs, DeclarativeBase):
     pass
 
@@ -30,6 +49,13 @@ class UserConfig(Base):
     api_key: Mapped[str] = mapped_column(String)
     trunk_id: Mapped[str] = mapped_column(String)
     last_checked_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=True)
+    # Курсор опроса: максимальный updated_at (по часам платформы) и id звонка,
+    # реально полученные для этой конфигурации. id нужен как тай-брейкер.
+    cursor_updated_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), nullable=True)
+    cursor_call_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    # До какого момента (по updated_at) платформа уже просмотрена, даже если звонков не было.
+    # Нижняя граница окна опроса - max(курсор, эта отметка), поэтому окно не растет у тихих конфигураций
+    scanned_through: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), nullable=True)
 
 # НОВАЯ ТАБЛИЦА: Шаблоны уведомлений
 class NotificationTemplate(Base):
@@ -40,7 +66,61 @@ class NotificationTemplate(Base):
     updated_by: Mapped[int] = mapped_column(BigInteger) # telegram_id администратора
     updated_at: Mapped[datetime.datetime] = mapped_column(DateTime, server_default=func.now())
 
+# История доставленных звонков. Таблица секционирована по месяцам (call_time),
+# секции создаются по мере необходимости через ensure_history_partitions()
+class CallHistory(Base):
+    __tablename__ = 'call_history'
+    __table_args__ = {'postgresql_partition_by': 'RANGE (call_time)'}
+    config_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    call_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # Ключ секционирования обязан входить в первичный ключ
+    call_time: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    outcome: Mapped[str] = mapped_column(String)
+    dialog_turns: Mapped[int] = mapped_column(Integer)
+    summarizing: Mapped[dict] = mapped_column(JSONB, nullable=True)
+
+# Дневные агрегаты по конфигурациям, обновляются инкрементально вместе с историей.
+# /stats читает только эту таблицу
+class CallDailyStats(Base):
+    __tablename__ = 'call_daily_stats'
+    config_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    day: Mapped[datetime.date] = mapped_column(Date, primary_key=True, index=True)
+    outcome: Mapped[str] = mapped_column(String, primary_key=True)
+    calls_count: Mapped[int] = mapped_column(Integer, default=0)
+
+# create_all не добавляет новые колонки в уже существующие таблицы,
+# поэтому дополнения схемы применяем идемпотентными ALTER'ами
+SCHEMA_UPGRADES = [
+    "ALTER TABLE user_configs ADD COLUMN IF NOT EXISTS cursor_updated_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE user_configs ADD COLUMN IF NOT EXISTS cursor_call_id BIGINT",
+    "ALTER TABLE user_configs ADD COLUMN IF NOT EXISTS scanned_through TIMESTAMP WITH TIME ZONE",
+]
+
 # Функция для создания таблиц
 async def async_main():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+        for statement in SCHEMA_UPGRADES:
+            await conn.execute(text(statement))
+
+# Секции call_history, которые уже точно существуют (кэш на процесс)
+_known_partitions: set[str] = set()
+
+async def ensure_history_partitions(call_times):
+    """Создает месячные секции call_history для переданных моментов времени, если их еще нет."""
+    months = set()
+    for call_time in call_times:
+        utc_time = call_time.astimezone(datetime.timezone.utc)
+        months.add((utc_time.year, utc_time.month))
+    missing = [(y, m) for y, m in sorted(months) if f"call_history_{y}_{m:02d}" not in _known_partitions]
+    if not missing:
+        return
+    async with engine.begin() as conn:
+        for year, month in missing:
+            next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+            name = f"call_history_{year}_{month:02d}"
+            await conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF call_history "
+                f"FOR VALUES FROM ('{year}-{month:02d}-01 00:00:00+00') TO ('{next_year}-{next_month:02d}-01 00:00:00+00')"
+            ))
+    _known_partitions.update(f"call_history_{y}_{m:02d}" for y, m in missing)
\ No newline at end of file
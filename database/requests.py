@@ -1,31 +1,59 @@
 # database/requests.py
 
 from .models import async_session, User
-from sqlalchemy import select
+from . import cache
+from .routing import run_read
+from sqlalchemy import select, exists
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import aliased
 import datetime
 
 # Функция для добавления нового пользователя
 async def add_user(tg_id: int, phone: str):
+    """
+    Регистрирует пользователя одним запросом: INSERT ... ON CONFLICT DO NOTHING в CTE
+    и проверки существующих строк в том же выражении.
+    Возвращает "ok", "user_exists" или "phone_exists".
+    """
+    inserted = (
+        pg_insert(User)
+        .values(telegram_id=tg_id, phone_number=phone)
+        .on_conflict_do_nothing()
+        .returning(User.telegram_id)
+        .cte("inserted")
+    )
+    # Основной SELECT видит таблицу на момент до вставки, поэтому EXISTS показывают,
+    # какое из уникальных полей уже было занято
+    stmt = select(
+        select(inserted.c.telegram_id).exists().label("inserted"),
+        exists().where(User.telegram_id == tg_id).label("user_exists"),
+        exists().where(User.phone_number == phone).label("phone_exists"),
+    )
     async with async_session() as session:
-        # Проверяем, нет ли уже пользователя с таким telegram_id или номером телефона
-        user_by_id = await session.get(User, tg_id)
-        if user_by_id:
-            return "user_exists"
-        
-        user_by_phone = await session.scalar(select(User).where(User.phone_number == phone))
-        if user_by_phone:
+        result = (await session.execute(stmt)).one()
+        await session.commit()
+
+    if not result.inserted:
+        if result.phone_exists and not result.user_exists:
             return "phone_exists"
+        # Сюда же попадает гонка, когда строку вставил параллельный запрос
+        # (чаще всего повторное нажатие того же пользователя)
+        return "user_exists"
 
-        # Если проверили и все чисто - добавляем
-        session.add(User(telegram_id=tg_id, phone_number=phone))
-        await session.commit()
-        return "ok"
+    # В кэше могли остаться отрицательные ответы ("не найден")
+    cache.users_by_id.invalidate(tg_id)
+    cache.users_by_phone.invalidate(phone)
+    return "ok"
 
 # Функция для получения информации о пользователе по его telegram_id
 async def get_user(tg_id: int):
+    user = cache.users_by_id.get(tg_id)
+    if user is not cache.MISSING:
+        return user
     async with async_session() as session:
-        return await session.get(User, tg_id)
+        user = await session.get(User, tg_id)
+    cache.users_by_id.set(tg_id, user)
+    return user
     
 
 
@@ -34,21 +62,29 @@ async def get_user(tg_id: int):
 # ... (старый код add_user и get_user) ...
 
 # Добавляем импорт новых моделей
-from .models import UserConfig, NotificationTemplate
-from sqlalchemy import update
+from .models import UserConfig, NotificationTemplate, CONFIGS_CHANNEL
+from sqlalchemy import update, insert, func
 
 # --- Функции для администратора ---
+# Тяжелые чтения (списки, экспорт, статистика) выполняются через run_read:
+# на реплике, если она настроена, иначе на основной БД
 
 async def get_all_users():
     """Возвращает список всех зарегистрированных пользователей."""
-    async with async_session() as session:
+    async def read(session):
         result = await session.execute(select(User).order_by(User.registered_at.desc()))
         return result.scalars().all()
+    return await run_read(read)
 
 async def get_user_by_phone(phone: str):
     """Находит пользователя по номеру телефона."""
+    user = cache.users_by_phone.get(phone)
+    if user is not cache.MISSING:
+        return user
     async with async_session() as session:
-        return await session.scalar(select(User).where(User.phone_number == phone))
+        user = await session.scalar(select(User).where(User.phone_number == phone))
+    cache.users_by_phone.set(phone, user)
+    return user
 
 async def add_user_config(phone: str, bot_id: str, api_key: str, trunk_id: str):
     """Добавляет связку параметров для пользователя."""
@@ -59,7 +95,46 @@ async def add_user_config(phone: str, bot_id: str, api_key: str, trunk_id: str):
             api_key=api_key,
             trunk_id=trunk_id
         ))
+        # NOTIFY доставляется слушателям только после коммита транзакции
+        await session.execute(select(func.pg_notify(CONFIGS_CHANNEL, phone)))
+        await session.commit()
+    cache.users_by_config.invalidate((bot_id, trunk_id, api_key))
+
+async def get_existing_phones(phones) -> set[str]:
+    """Возвращает те номера из переданных, которые есть в таблице users (одним запросом)."""
+    phones = list(set(phones))
+    if not phones:
+        return set()
+    async with async_session() as session:
+        result = await session.scalars(select(User.phone_number).where(User.phone_number.in_(phones)))
+        return set(result.all())
+
+async def get_existing_config_keys(bot_ids) -> set[tuple[str, str, str]]:
+    """Возвращает уже назначенные связки (bot_id, trunk_id, api_key) для переданных bot_id."""
+    bot_ids = list(set(bot_ids))
+    if not bot_ids:
+        return set()
+    async with async_session() as session:
+        result = await session.execute(
+            select(UserConfig.bot_id, UserConfig.trunk_id, UserConfig.api_key)
+            .where(UserConfig.bot_id.in_(bot_ids))
+        )
+        return {tuple(row) for row in result.all()}
+
+async def add_user_configs_bulk(rows: list[dict]) -> int:
+    """
+    Добавляет много конфигураций одним executemany в одной транзакции.
+    Каждая строка - словарь с ключами user_phone, bot_id, api_key, trunk_id.
+    """
+    if not rows:
+        return 0
+    async with async_session() as session:
+        await session.execute(insert(UserConfig), rows)
+        await session.execute(select(func.pg_notify(CONFIGS_CHANNEL, "bulk")))
         await session.commit()
+    for row in rows:
+        cache.users_by_config.invalidate((row["bot_id"], row["trunk_id"], row["api_key"]))
+    return len(rows)
 
 # --- Функции для работы с шаблонами ---
 
@@ -90,6 +165,10 @@ async def find_user_by_config(bot_id: str, trunk_id: str, api_key: str):
     """
     Находит пользователя (User) по его конфигурации (UserConfig).
     """
+    key = (bot_id, trunk_id, api_key)
+    user = cache.users_by_config.get(key)
+    if user is not cache.MISSING:
+        return user
     async with async_session() as session:
         # Выполняем запрос с объединением (JOIN) двух таблиц
         query = (
@@ -103,7 +182,9 @@ async def find_user_by_config(bot_id: str, trunk_id: str, api_key: str):
         )
         result = await session.execute(query)
         # scalar_one_or_none() вернет одного пользователя или None, если не найдено
-        return result.scalar_one_or_none()
+        user = result.scalar_one_or_none()
+    cache.users_by_config.set(key, user)
+    return user
     
 
 
@@ -112,7 +193,7 @@ async def get_all_users_with_configs():
     """
     Возвращает объединенный список всех пользователей и их конфигураций.
     """
-    async with async_session() as session:
+    async def read(session):
         # Используем LEFT JOIN, чтобы включить даже тех пользователей,
         # у которых еще нет конфигураций
         query = (
@@ -128,29 +209,169 @@ async def get_all_users_with_configs():
         )
         result = await session.execute(query)
         return result.all()
+    return await run_read(read)
     
 
 async def get_all_active_configs():
-    """Возвращает все активные конфигурации вместе с telegram_id пользователя."""
+    """Возвращает все активные конфигурации вместе с telegram_id пользователя и курсором опроса."""
     async with async_session() as session:
         query = (
             select(
+                UserConfig.id.label("config_id"),
                 User.telegram_id,
                 UserConfig.api_key,
                 UserConfig.bot_id,
-                UserConfig.last_checked_at
+                UserConfig.trunk_id,
+                UserConfig.last_checked_at,
+                UserConfig.cursor_updated_at,
+                UserConfig.cursor_call_id,
+                UserConfig.scanned_through
             )
             .join(UserConfig, User.phone_number == UserConfig.user_phone)
         )
         result = await session.execute(query)
         return result.all()
 
-async def update_config_check_time(api_key: str, bot_id: str, check_time: datetime.datetime):
-    """Обновляет время последней проверки для конкретной конфигурации."""
+async def update_config_check_time(config_id: int, check_time: datetime.datetime,
+                                   cursor: tuple[datetime.datetime, int] | None = None,
+                                   scanned_through: datetime.datetime | None = None):
+    """
+    Обновляет время последней проверки для конкретной конфигурации.
+    Если передан курсор (updated_at, id последнего полученного звонка) - сдвигает и его,
+    если передана отметка просмотра - тоже.
+    """
+    values = {"last_checked_at": check_time}
+    if cursor is not None:
+        values["cursor_updated_at"], values["cursor_call_id"] = cursor
+    if scanned_through is not None:
+        values["scanned_through"] = scanned_through
     async with async_session() as session:
         await session.execute(
             update(UserConfig)
-            .where(UserConfig.api_key == api_key, UserConfig.bot_id == bot_id)
-            .values(last_checked_at=check_time)
+            .where(UserConfig.id == config_id)
+            .values(**values)
         )
-        await session.commit()
\ No newline at end of file
+        await session.commit()
+
+# --- История звонков и статистика ---
+
+from collections import Counter
+from zoneinfo import ZoneInfo
+from config import STATS_OUTCOME_FIELD, STATS_TIMEZONE
+from .models import CallHistory, CallDailyStats, ensure_history_partitions
+
+STATS_TZ = ZoneInfo(STATS_TIMEZONE)
+UNKNOWN_OUTCOME = "не указан"
+
+def _call_outcome(summarizing) -> str:
+    if isinstance(summarizing, dict):
+        value = summarizing.get(STATS_OUTCOME_FIELD)
+        if value not in (None, ""):
+            return str(value)[:100]
+    return UNKNOWN_OUTCOME
+
+async def record_calls(config_id: int, calls: list[dict]) -> set[int]:
+    """
+    Сохраняет звонки в историю и в той же транзакции увеличивает дневные агрегаты.
+    Вызывается после успешной отправки уведомления. Уже сохраненные ранее звонки
+    пропускаются. Возвращает id впервые сохраненных звонков.
+    """
+    rows = [
+        {
+            "config_id": config_id,
+            "call_id": call["cursor_key"][1],
+            "call_time": call["created_at"],
+            "outcome": _call_outcome(call["summarizing"]),
+            "dialog_turns": call["dialog_turns"],
+            "summarizing": call["summarizing"] or None,
+        }
+        for call in calls
+        if call.get("created_at") is not None and call.get("cursor_key") is not None and call["cursor_key"][1] >= 0
+    ]
+    if not rows:
+        return set()
+
+    await ensure_history_partitions(row["call_time"] for row in rows)
+    async with async_session() as session:
+        result = await session.execute(
+            pg_insert(CallHistory)
+            .values(rows)
+            .on_conflict_do_nothing()
+            .returning(CallHistory.call_id, CallHistory.call_time, CallHistory.outcome)
+        )
+        inserted = result.all()
+
+        counts = Counter((row.call_time.astimezone(STATS_TZ).date(), row.outcome) for row in inserted)
+        if counts:
+            stmt = pg_insert(CallDailyStats).values([
+                {"config_id": config_id, "day": day, "outcome": outcome, "calls_count": count}
+                for (day, outcome), count in counts.items()
+            ])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[CallDailyStats.config_id, CallDailyStats.day, CallDailyStats.outcome],
+                set_={"calls_count": CallDailyStats.calls_count + stmt.excluded.calls_count}
+            )
+            await session.execute(stmt)
+        await session.commit()
+    return {row.call_id for row in inserted}
+
+async def get_recorded_call_ids(config_id: int, call_ids) -> set[int]:
+    """
+    Какие из звонков уже есть в истории, то есть уже доставлены (опросом или push-событием).
+    Читает с основной БД: реплика может еще не знать о только что отправленных звонках.
+    """
+    call_ids = list(call_ids)
+    if not call_ids:
+        return set()
+    async with async_session() as session:
+        result = await session.scalars(
+            select(CallHistory.call_id)
+            .where(CallHistory.config_id == config_id, CallHistory.call_id.in_(call_ids))
+        )
+        return set(result.all())
+
+def stats_today() -> datetime.date:
+    return datetime.datetime.now(STATS_TZ).date()
+
+async def get_user_stats(tg_id: int, since: datetime.date):
+    """Возвращает строки (day, outcome, calls_count) по всем конфигурациям пользователя начиная с since."""
+    async def read(session):
+        query = (
+            select(CallDailyStats.day, CallDailyStats.outcome, func.sum(CallDailyStats.calls_count).label("calls_count"))
+            .join(UserConfig, UserConfig.id == CallDailyStats.config_id)
+            .join(User, User.phone_number == UserConfig.user_phone)
+            .where(User.telegram_id == tg_id, CallDailyStats.day >= since)
+            .group_by(CallDailyStats.day, CallDailyStats.outcome)
+        )
+        result = await session.execute(query)
+        return result.all()
+    return await run_read(read)
+
+async def get_all_stats(since: datetime.date):
+    """Возвращает строки (day, outcome, calls_count) по всем конфигурациям начиная с since."""
+    async def read(session):
+        query = (
+            select(CallDailyStats.day, CallDailyStats.outcome, func.sum(CallDailyStats.calls_count).label("calls_count"))
+            .where(CallDailyStats.day >= since)
+            .group_by(CallDailyStats.day, CallDailyStats.outcome)
+        )
+        result = await session.execute(query)
+        return result.all()
+    return await run_read(read)
+
+async def get_top_users_by_calls(since: datetime.date, limit: int = 10):
+    """Возвращает пользователей с наибольшим числом звонков начиная с since: (phone_number, calls_count)."""
+    async def read(session):
+        calls_count = func.sum(CallDailyStats.calls_count).label("calls_count")
+        query = (
+            select(UserConfig.user_phone.label("phone_number"), calls_count)
+            .select_from(CallDailyStats)
+            .join(UserConfig, UserConfig.id == CallDailyStats.config_id)
+            .where(CallDailyStats.day >= since)
+            .group_by(UserConfig.user_phone)
+            .order_by(calls_count.desc())
+            .limit(limit)
+        )
+        result = await session.execute(query)
+        return result.all()
+    return await run_read(read)
\ No newline at end of file
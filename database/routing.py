@@ -0,0 +1,74 @@
+# database/routing.py
+
+import asyncio
+import logging
+import time
+
+from sqlalchemy import exc, text
+
+from config import DB_REPLICA_MAX_LAG
+from .models import async_session, async_read_session
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять отставание реплики, в секундах
+REPLICA_HEALTH_INTERVAL = 30
+# Сколько не обращаться к реплике после ошибки подключения, в секундах
+REPLICA_RETRY_AFTER = 60
+
+# Отставание реплики в секундах; 0, если реплика догнала основную БД или это не реплика
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+# Ошибки, при которых реплика считается недоступной
+REPLICA_ERRORS = (OSError, asyncio.TimeoutError, exc.OperationalError, exc.InterfaceError)
+
+_replica_usable = True
+_checked_at = 0.0
+
+def _mark_replica_down(reason):
+    global _replica_usable, _checked_at
+    _replica_usable = False
+    # Следующая проверка - через REPLICA_RETRY_AFTER
+    _checked_at = time.monotonic() + REPLICA_RETRY_AFTER - REPLICA_HEALTH_INTERVAL
+    logger.warning(f"Реплика недоступна, чтение переключено на основную БД: {reason}")
+
+async def _check_replica() -> bool:
+    """Проверяет отставание реплики не чаще раза в REPLICA_HEALTH_INTERVAL секунд."""
+    global _replica_usable, _checked_at
+    if time.monotonic() - _checked_at < REPLICA_HEALTH_INTERVAL:
+        return _replica_usable
+    _checked_at = time.monotonic()
+    try:
+        async with async_read_session() as session:
+            lag = float(await session.scalar(REPLICA_LAG_SQL))
+    except REPLICA_ERRORS as e:
+        _mark_replica_down(e)
+        return False
+    usable = lag <= DB_REPLICA_MAX_LAG
+    if usable != _replica_usable:
+        if usable:
+            logger.info(f"Реплика снова используется для чтения (отставание {lag:.1f} с).")
+        else:
+            logger.warning(f"Реплика отстает на {lag:.1f} с (допустимо {DB_REPLICA_MAX_LAG} с), читаем с основной БД.")
+    _replica_usable = usable
+    return usable
+
+async def run_read(query):
+    """
+    Выполняет функцию чтения query(session) на реплике, если она настроена, доступна
+    и отстает не больше DB_REPLICA_MAX_LAG. Иначе - на основной БД.
+    Подходит только для чтений, которым не важны только что сделанные записи.
+    """
+    if async_read_session is not None and await _check_replica():
+        try:
+            async with async_read_session() as session:
+                return await query(session)
+        except REPLICA_ERRORS as e:
+            _mark_replica_down(e)
+    async with async_session() as session:
+        return await query(session)
@@ -2,7 +2,7 @@
 
 import logging
 from aiogram import Router, types, F, Bot
-from aiogram.filters import Command, Filter
+from aiogram.filters import Command, CommandObject, Filter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import ReplyKeyboardBuilder
@@ -11,9 +11,12 @@ from datetime import datetime
 
 from config import ADMIN_IDS
 from database.requests import (get_all_users, get_user_by_phone,
-                               add_user_config, get_active_template, set_new_template)
+                               add_user_config, get_active_template, set_new_template,
+                               get_all_stats, get_top_users_by_calls, stats_today)
+from call_stats import render_stats, stats_period_start
+from profiling import profiler
 from bot_commands import set_user_commands
-from g_sheets import export_to_google_sheet
+from csv_import import import_configs_from_csv
 
 # Создаем именованный логгер для этого файла
 logger = logging.getLogger(__name__)
@@ -39,6 +42,9 @@ class AssignData(StatesGroup):
 class EditTemplate(StatesGroup):
     waiting_for_template = State()
 
+class ImportConfigs(StatesGroup):
+    waiting_for_file = State()
+
 # --- Роутер и его фильтрация (остается без изменений) ---
 router = Router()
 router.message.filter(IsAdmin())
@@ -51,7 +57,8 @@ def admin_keyboard():
     builder.button(text="📄 Показать шаблон")
     builder.button(text="✏️ Редактировать шаблон")
     builder.button(text="📈 Экспорт в Google Sheets")
-    builder.adjust(2, 2, 1)
+    builder.button(text="📥 Импорт из CSV")
+    builder.adjust(2, 2, 2)
     return builder.as_markup(resize_keyboard=True, input_field_placeholder="Выберите действие:")
 
 # --- Обработчики команд ---
@@ -94,6 +101,40 @@ async def cmd_list_users(message: types.Message):
         user_list_parts.append(line)
     await message.answer("".join(user_list_parts), parse_mode="HTML")
 
+# Команда /stats_all - сводная статистика по всем пользователям
+@router.message(Command("stats_all"))
+async def cmd_stats_all(message: types.Message):
+    admin_id = message.from_user.id
+    logger.info(f"Администратор {admin_id} запросил сводную статистику звонков.")
+    today = stats_today()
+    since = stats_period_start(today)
+    rows = await get_all_stats(since)
+    if not rows:
+        await message.answer("За последнюю неделю звонков не было.")
+        return
+    text = render_stats("📊 Статистика звонков по всем пользователям", rows, today)
+    top_users = await get_top_users_by_calls(since)
+    if top_users:
+        lines = [f"  <code>{user.phone_number}</code> - {user.calls_count}" for user in top_users]
+        text += "\n\n<b>Больше всего звонков:</b>\n" + "\n".join(lines)
+    await message.answer(text, parse_mode="HTML")
+
+# Команда /profile [N] - профилировать следующие N циклов планировщика
+MAX_PROFILE_CYCLES = 20
+
+@router.message(Command("profile"))
+async def cmd_profile(message: types.Message, command: CommandObject):
+    admin_id = message.from_user.id
+    try:
+        cycles = int(command.args) if command.args else 1
+    except ValueError:
+        await message.answer("Использование: /profile [количество циклов], например /profile 3")
+        return
+    cycles = max(1, min(cycles, MAX_PROFILE_CYCLES))
+    profiler.arm(cycles, requested_by=admin_id)
+    logger.info(f"Администратор {admin_id} включил профилирование {cycles} циклов планировщика.")
+    await message.answer(f"⏱ Следующие {cycles} цикл(ов) планировщика будут профилированы. Отчет придет файлом.")
+
 # --- Тестовая рассылка ---
 @router.message(Command("test_broadcast"))
 @router.message(F.text == "📢 Тестовая рассылка")
@@ -202,6 +243,67 @@ async def process_assign_trunk_id(message: types.Message, state: FSMContext):
     )
     await state.clear()
 
+# --- Массовое назначение данных из CSV (/import_configs) ---
+
+MAX_IMPORT_FILE_SIZE = 5 * 1024 * 1024
+# Сколько ошибок показывать прямо в сообщении; полный отчет уходит файлом
+MAX_ERRORS_IN_MESSAGE = 20
+
+@router.message(Command("import_configs"))
+@router.message(F.text == "📥 Импорт из CSV")
+async def cmd_import_configs(message: types.Message, state: FSMContext):
+    admin_id = message.from_user.id
+    logger.info(f"Администратор {admin_id} начал массовый импорт конфигураций.")
+    await message.answer(
+        "Отправьте CSV-файл со столбцами <code>phone, bot_id, api_key, trunk_id</code> "
+        "(разделитель - запятая или точка с запятой, строка заголовка необязательна).\n\n"
+        "<i>Для отмены введите /cancel.</i>",
+        parse_mode="HTML",
+        reply_markup=types.ReplyKeyboardRemove()
+    )
+    await state.set_state(ImportConfigs.waiting_for_file)
+
+@router.message(ImportConfigs.waiting_for_file, F.document)
+async def process_import_file(message: types.Message, state: FSMContext, bot: Bot):
+    admin_id = message.from_user.id
+    document = message.document
+    if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+        logger.warning(f"Администратор {admin_id} отправил слишком большой файл для импорта ({document.file_size} байт).")
+        await message.answer("Файл слишком большой (максимум 5 МБ). Разбейте его на части и попробуйте еще раз.")
+        return
+
+    logger.info(f"Администратор {admin_id} загрузил файл '{document.file_name}' для импорта.")
+    processing_message = await message.answer("⏳ Проверяю и импортирую файл...")
+    try:
+        file = await bot.download(document)
+        added, errors = await import_configs_from_csv(file)
+    except Exception as e:
+        logger.exception(f"Ошибка при импорте конфигураций администратором {admin_id}:")
+        await processing_message.edit_text(f"❌ <b>Ошибка при импорте!</b>\n\nПричина: <code>{html.escape(str(e))}</code>", parse_mode="HTML")
+        return
+
+    report = [f"✅ Импорт завершен. Добавлено конфигураций: {added}. Ошибок: {len(errors)}."]
+    if errors:
+        report.append("")
+        report.extend(errors[:MAX_ERRORS_IN_MESSAGE])
+        if len(errors) > MAX_ERRORS_IN_MESSAGE:
+            report.append(f"... и еще {len(errors) - MAX_ERRORS_IN_MESSAGE}. Полный отчет - в файле ниже.")
+    await processing_message.edit_text("\n".join(report))
+
+    if len(errors) > MAX_ERRORS_IN_MESSAGE:
+        report_file = types.BufferedInputFile(
+            file="\n".join(errors).encode('utf-8'),
+            filename="import_errors.txt"
+        )
+        await message.answer_document(report_file)
+
+    await message.answer("Готово.", reply_markup=admin_keyboard())
+    await state.clear()
+
+@router.message(ImportConfigs.waiting_for_file)
+async def process_import_not_a_file(message: types.Message):
+    await message.answer("Пришлите CSV-файл документом или введите /cancel для отмены.")
+
 # --- Процесс управления шаблонами ---
 
 DEFAULT_TEMPLATE = """<b>📞 Новый звонок</b>
@@ -271,6 +373,9 @@ async def cmd_export_gsheet(message: types.Message):
     # Отправляем уведомление о начале процесса
     processing_message = await message.answer("⏳ Начинаю экспорт данных... Это может занять некоторое время.")
 
+    # g_sheets тянет за собой pandas и gspread - загружаем их только при первом экспорте
+    from g_sheets import export_to_google_sheet
+
     success, result = await export_to_google_sheet()
 
     if success:
@@ -1,15 +1,15 @@
 # handlers/user_handlers.py
 
 import logging
-import re
 from aiogram import Router, Bot
 from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram import types
-import phonenumbers
 
-from database.requests import add_user, get_user
+from database.requests import add_user, get_user, get_user_stats, stats_today
+from phones import parse_russian_phone
+from call_stats import render_stats, stats_period_start
 from bot_commands import set_user_commands
 from config import ADMIN_IDS
 from handlers.admin_handlers import admin_keyboard
@@ -37,11 +37,16 @@ async def cmd_help(message: types.Message):
             "  <i>Показывает полный список зарегистрированных пользователей, их номера телефонов и Telegram ID.</i>\n\n"
             "  <code>📎 Назначить данные</code>\n"
             "  <i>Запускает пошаговый процесс привязки конфигурации (bot_id, api_key, trunk_id) к номеру телефона пользователя. Эта связка определяет, какие уведомления будет получать клиент.</i>\n\n"
+            "  <code>📥 Импорт из CSV</code>\n"
+            "  <i>Назначает конфигурации сразу многим пользователям из CSV-файла (phone, bot_id, api_key, trunk_id) и присылает отчет об ошибках по строкам.</i>\n\n"
             "<b>Управление шаблонами:</b>\n"
             "  <code>📄 Показать шаблон</code>\n"
             "  <i>Показывает текущий активный шаблон, по которому формируются все уведомления.</i>\n\n"
             "  <code>✏️ Редактировать шаблон</code>\n"
             "  <i>Позволяет установить новый шаблон. Поддерживаются HTML-теги для форматирования и переменные.</i>\n\n"
+            "<b>Статистика:</b>\n"
+            "  /stats_all - <i>Сводная статистика звонков по всем пользователям за неделю.</i>\n"
+            "  /profile N - <i>Профилировать следующие N циклов планировщика, отчет придет файлом.</i>\n\n"
             "<b>Основные команды:</b>\n"
             "  /start или /admin - <i>Показать главное меню и клавиатуру.</i>\n"
             "  /help - <i>Показать эту справку.</i>"
@@ -59,6 +64,7 @@ async def cmd_help(message: types.Message):
             "Как только всё будет настроено, вы начнёте автоматически получать отчеты о звонках.\n\n"
             "<b>Доступные команды:</b>\n"
             "  /start - <i>Начать работу или перезапустить бота.</i>\n"
+            "  /stats - <i>Статистика звонков за последнюю неделю.</i>\n"
             "  /help - <i>Показать эту справку.</i>"
         )
         await message.answer(user_help_text, parse_mode="HTML")
@@ -95,6 +101,19 @@ async def cmd_start(message: types.Message, state: FSMContext, bot: Bot):
     await state.set_state(Registration.waiting_for_phone_number)
 
 
+# --- Обработчик команды /stats: статистика читается только из дневных агрегатов ---
+@router.message(Command("stats"))
+async def cmd_stats(message: types.Message):
+    user_id = message.from_user.id
+    logger.info(f"Пользователь {user_id} запросил статистику звонков.")
+    today = stats_today()
+    rows = await get_user_stats(user_id, stats_period_start(today))
+    if not rows:
+        await message.answer("За последнюю неделю звонков не было.")
+        return
+    await message.answer(render_stats("📊 Статистика звонков", rows, today), parse_mode="HTML")
+
+
 # --- Обработчик получения номера (без изменений) ---
 @router.message(Registration.waiting_for_phone_number)
 async def process_phone_number(message: types.Message, state: FSMContext):
@@ -103,15 +122,7 @@ async def process_phone_number(message: types.Message, state: FSMContext):
     logger.info(f"Пользователь {user_id} ввел номер телефона: '{phone_number}'")
 
     try:
-        cleaned_phone = re.sub(r'[^\d+]', '', phone_number)
-        parsed_phone = phonenumbers.parse(cleaned_phone, "RU")
-        if not phonenumbers.is_valid_number(parsed_phone) or parsed_phone.country_code != 7:
-            raise ValueError("Некорректный российский номер")
-            
-        normalized_phone = phonenumbers.format_number(
-            parsed_phone, phonenumbers.PhoneNumberFormat.E164
-        )
-        
+        normalized_phone = parse_russian_phone(phone_number)
         logger.debug(f"Номер {phone_number} для пользователя {user_id} нормализован в {normalized_phone}")
         result = await add_user(user_id, normalized_phone)
 
@@ -0,0 +1,53 @@
+# json_backend.py
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# orjson - необязательная зависимость. Без него работаем на стандартном json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson.JSONDecodeError - подкласс json.JSONDecodeError, так что ловить можно одно исключение
+JSONDecodeError = json.JSONDecodeError
+
+def _std_loads(data):
+    return json.loads(data)
+
+def _std_dumps_pretty(obj) -> str:
+    return json.dumps(obj, indent=2, ensure_ascii=False)
+
+def _orjson_loads(data):
+    # orjson выигрывает на байтах ответа, а вложенные строки с кириллицей ему
+    # приходится сначала перекодировать в UTF-8 - на них стандартный json не медленнее
+    # (см. benchmarks/bench_json_decode.py)
+    if isinstance(data, str):
+        return json.loads(data)
+    return orjson.loads(data)
+
+def _orjson_dumps_pretty(obj) -> str:
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode('utf-8')
+    except TypeError:
+        # orjson не умеет, например, целые больше 64 бит - отдаем стандартному json
+        return _std_dumps_pretty(obj)
+
+loads = _std_loads
+dumps_pretty = _std_dumps_pretty
+BACKEND = "json"
+
+def use_backend(name: str):
+    """Переключает реализацию loads/dumps_pretty: 'orjson' или 'json'."""
+    global loads, dumps_pretty, BACKEND
+    if name == "orjson" and orjson is not None:
+        loads, dumps_pretty, BACKEND = _orjson_loads, _orjson_dumps_pretty, "orjson"
+    else:
+        if name == "orjson":
+            logger.warning("orjson не установлен, используется стандартный json.")
+        loads, dumps_pretty, BACKEND = _std_loads, _std_dumps_pretty, "json"
+
+# JSON_BACKEND=json принудительно включает стандартную библиотеку
+use_backend(os.getenv("JSON_BACKEND", "orjson"))
@@ -1,21 +1,47 @@
 # main.py
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import asyncio
 import logging
+import sys
 
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from config import BOT_TOKEN
+from config import (BOT_TOKEN, PROFILE_CYCLES, POLL_INTERVAL_MINUTES,
+                    PUSH_SECRET, RECONCILE_INTERVAL_MINUTES)
 from handlers import user_handlers, admin_handlers
 from database.models import async_main as db_init
 from logging_config import setup_logging
 from scheduler import check_new_calls_and_notify
+from profiling import profiler
+from platform_api import shutdown_parse_pool
+
+IMPORT_TIME = time.perf_counter() - _IMPORT_STARTED
+
+# Тяжелые зависимости, которые должны загружаться только при первом использовании
+LAZY_MODULES = ("pandas", "gspread", "phonenumbers")
+# Бюджет времени импорта модулей бота, в секундах
+IMPORT_TIME_BUDGET = 1.5
+
+def check_startup_imports() -> list[str]:
+    """
+    Проверяет, что старт не регрессировал: тяжелые модули не загружены
+    при импорте, а импорт уложился в бюджет. Возвращает список нарушений.
+    """
+    problems = [f"модуль {name} загружен при старте" for name in LAZY_MODULES if name in sys.modules]
+    if IMPORT_TIME > IMPORT_TIME_BUDGET:
+        problems.append(f"импорт занял {IMPORT_TIME:.2f} с (бюджет {IMPORT_TIME_BUDGET} с)")
+    return problems
 
 async def main():
     setup_logging()
     logger = logging.getLogger(__name__)
-    logger.info("Запуск бота...")
+    logger.info(f"Запуск бота... Импорт модулей занял {IMPORT_TIME:.3f} с.")
+    for problem in check_startup_imports():
+        logger.warning(f"Регрессия времени старта: {problem}.")
 
     await db_init()
 
@@ -25,23 +51,47 @@ async def main():
     dp.include_router(admin_handlers.router)
     dp.include_router(user_handlers.router)
     
+    # --- Push-события платформы ---
+    # Если push включен, опрос остается только сверкой на случай потерянных событий
+    push_runner = None
+    poll_interval = POLL_INTERVAL_MINUTES
+    if PUSH_SECRET:
+        from push_server import start_push_server
+        push_runner = await start_push_server(bot)
+        poll_interval = RECONCILE_INTERVAL_MINUTES
+
     # --- Настройка и запуск планировщика ---
     scheduler = AsyncIOScheduler(timezone="Europe/Moscow")
     scheduler.add_job(
         check_new_calls_and_notify,
         trigger='interval',
         #seconds=100,
-        minutes=3,
+        minutes=poll_interval,
         kwargs={'bot': bot}
     )
     scheduler.start()
+    if PROFILE_CYCLES > 0:
+        profiler.arm(PROFILE_CYCLES)
     
-    logger.info("Планировщик запущен и настроен.")
+    logger.info(f"Планировщик запущен и настроен: опрос платформы раз в {poll_interval} мин.")
 
     await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    logger.info(f"Бот готов к работе через {time.perf_counter() - _IMPORT_STARTED:.3f} с после старта процесса.")
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if push_runner is not None:
+            await push_runner.cleanup()
+        shutdown_parse_pool()
 
 if __name__ == "__main__":
+    # python main.py --check-imports: проверка для CI, завершается с кодом 1 при регрессии
+    if "--check-imports" in sys.argv:
+        problems = check_startup_imports()
+        for problem in problems:
+            print(f"FAIL: {problem}")
+        print(f"Импорт модулей: {IMPORT_TIME:.3f} с")
+        sys.exit(1 if problems else 0)
     try:
         asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
@@ -0,0 +1,25 @@
+# phones.py
+import re
+
+# Канонический российский мобильный номер: такой ввод не нужно прогонять через phonenumbers
+CANONICAL_PHONE_RE = re.compile(r'\+79\d{9}')
+
+def parse_russian_phone(phone_number: str) -> str:
+    """
+    Приводит российский номер к E.164 (+7XXXXXXXXXX), как он хранится в users.phone_number.
+    ValueError, если это не корректный российский номер.
+    """
+    cleaned_phone = re.sub(r'[^\d+]', '', phone_number)
+    if CANONICAL_PHONE_RE.fullmatch(cleaned_phone):
+        return cleaned_phone
+
+    # phonenumbers с таблицами метаданных загружаем при первой необходимости, а не при старте
+    import phonenumbers
+
+    try:
+        parsed_phone = phonenumbers.parse(cleaned_phone, "RU")
+    except phonenumbers.NumberParseException as e:
+        raise ValueError(str(e)) from e
+    if not phonenumbers.is_valid_number(parsed_phone) or parsed_phone.country_code != 7:
+        raise ValueError("Некорректный российский номер")
+    return phonenumbers.format_number(parsed_phone, phonenumbers.PhoneNumberFormat.E164)
@@ -1,15 +1,45 @@
 
 # platform_api.py
 import aiohttp
+import asyncio
 import datetime
 import json
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import json_backend
+from config import PARSE_POOL_WORKERS, PARSE_OFFLOAD_THRESHOLD
+from profiling import profiler
 
 logger = logging.getLogger(__name__)
 
 BASE_URL = "https://api.client.za-bota.com/v1/calls"
 LIMIT = 50
 
+# Перекрытие окна запроса относительно курсора. Звонки на границе окна
+# (округление фильтра на стороне платформы) и звонки, которые появились в API позже,
+# чем получили свой updated_at, не теряются. Внутри окна звонки по курсору не
+# отсекаются: уже доставленные отбрасывает проверка по истории звонков.
+CURSOR_OVERLAP = datetime.timedelta(minutes=2)
+# Отметка просмотра ставится с отступом от конца окна: звонок мог получить updated_at
+# чуть раньше, чем стал виден в API (и часы платформы могут расходиться с нашими)
+SCAN_SAFETY_LAG = datetime.timedelta(minutes=2)
+
+# --- Режим догонки после простоя ---
+# Разрыв больше порога делится на срезы, которые запрашиваются параллельно
+CATCHUP_THRESHOLD = datetime.timedelta(hours=1)
+CATCHUP_SLICE = datetime.timedelta(hours=1)
+# Сколько страниц по LIMIT звонков максимум забираем за одно окно
+MAX_PAGES_PER_WINDOW = 20
+# Сколько запросов к платформе одновременно допускается на один api_key
+CONCURRENCY_PER_API_KEY = 3
+_key_semaphores: dict[str, asyncio.Semaphore] = {}
+
+# Пул процессов для разбора больших страниц (создается при первом использовании)
+_parse_pool: ProcessPoolExecutor | None = None
+
 # --- ЗАГОЛОВКИ, КОТОРЫЕ ИМИТИРУЮТ БРАУЗЕР/REQUESTS ---
 # Это часто помогает обойти простые защиты на серверах
 IMITATION_HEADERS = {
@@ -18,97 +48,302 @@ IMITATION_HEADERS = {
     'Accept-Language': 'en-US,en;q=0.5',
 }
 
-async def get_new_calls(api_key: str, bot_id: str, last_check_time: datetime.datetime) -> list:
-    start_date_str = last_check_time.isoformat()
-    current_date_str = datetime.datetime.now().isoformat()
-    
+def parse_platform_time(value) -> datetime.datetime | None:
+    """Разбирает время из ответа платформы. Время без часового пояса считается UTC."""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+def _call_id_as_int(call_id) -> int:
+    try:
+        return int(call_id)
+    except (TypeError, ValueError):
+        return -1
+
+def _decode_nested(value):
+    """Вложенные поля платформа присылает то строкой с JSON, то уже объектом."""
+    return json_backend.loads(value) if isinstance(value, str) else value
+
+def parse_call(call: dict, call_key) -> dict | None:
+    """Превращает звонок из ответа платформы в данные для уведомления. None - звонок без данных."""
+    call_id = call.get('id', 'N/A')
+    call_time = call.get('created_at', 'N/A')
+
+    variables_data = call.get('variables')
+    if not variables_data:
+        return None
+    variables = _decode_nested(variables_data)
+
+    storage = call.get('storage')
+    call_uuid = call.get('uuid')
+    audio_file = variables.get('all_audio_record')
+    if storage and call_uuid and audio_file:
+        audio_link = f"https://client.za-bota.com/calls/storage/{storage}/{call_uuid}/{audio_file}"
+    else:
+        audio_link = "Ссылка недоступна"
+
+    summarizing_data = variables.get('summarizing', {})
+    if isinstance(summarizing_data, str) and summarizing_data:
+        try:
+            summarizing_obj = json_backend.loads(summarizing_data)
+        except json_backend.JSONDecodeError:
+            summarizing_obj = {"raw_text": summarizing_data}
+    else:
+        summarizing_obj = summarizing_data if summarizing_data else {}
+    summarizing_pretty = json_backend.dumps_pretty(summarizing_obj)
+
+    dialog = variables.get('dialog', [])
+    transcription_parts = [f"Транскрибация звонка ID: {call_id}\nДата: {call_time}\n\n"]
+    for msg in dialog:
+        if "user" in msg:
+            transcription_parts.append(f"Клиент: {msg['user']}\n\n")
+        elif "assistant" in msg and msg['assistant'].get('state') in ('active', 'last'):
+            transcription_parts.append(f"Ассистент: {msg['assistant'].get('message', '')}\n\n")
+
+    return {
+        "call_id": call_id,
+        "cursor_key": call_key,
+        "call_time": call_time,
+        "created_at": parse_platform_time(call_time),
+        "audio_link": audio_link,
+        "summarizing": summarizing_obj,
+        "summarizing_pretty": summarizing_pretty,
+        "dialog_turns": len(dialog),
+        "transcription_text": "".join(transcription_parts),
+        "transcription_filename": f"transcription_{call_id}.txt"
+    }
+
+def parse_calls(calls_list: list, cursor_key: tuple) -> tuple[list, tuple | None]:
+    """
+    Разбирает страницу звонков. Звонки не новее курсора отбрасываются до разбора
+    вложенных полей, так что variables декодируются только для новых звонков.
+    Возвращает (звонки по возрастанию курсора, новый курсор или None).
+    """
+    processed_calls = []
+    new_cursor = None
+    for call in calls_list:
+        # Отсекаем звонки из зоны перекрытия, которые уже были получены
+        updated_at = parse_platform_time(call.get('updated_at')) or parse_platform_time(call.get('created_at'))
+        call_key = None
+        if updated_at is not None:
+            call_key = (updated_at, _call_id_as_int(call.get('id')))
+            if call_key <= cursor_key:
+                continue
+            if new_cursor is None or call_key > new_cursor:
+                new_cursor = call_key
+
+        processed = parse_call(call, call_key)
+        if processed is not None:
+            processed_calls.append(processed)
+
+    # Курсор двигается по порядку updated_at, поэтому и отправляем в этом порядке
+    processed_calls.sort(key=lambda c: c["cursor_key"] or cursor_key)
+    return processed_calls, new_cursor
+
+def _semaphore_for(api_key: str) -> asyncio.Semaphore:
+    semaphore = _key_semaphores.get(api_key)
+    if semaphore is None:
+        semaphore = _key_semaphores[api_key] = asyncio.Semaphore(CONCURRENCY_PER_API_KEY)
+    return semaphore
+
+def split_window(start: datetime.datetime, end: datetime.datetime) -> list[tuple[datetime.datetime, datetime.datetime]]:
+    """Делит большой интервал на срезы по CATCHUP_SLICE. Небольшой интервал остается одним окном."""
+    if end - start <= CATCHUP_THRESHOLD:
+        return [(start, end)]
+    slices = []
+    slice_start = start
+    while slice_start < end:
+        slice_end = min(slice_start + CATCHUP_SLICE, end)
+        slices.append((slice_start, slice_end))
+        slice_start = slice_end
+    return slices
+
+def parse_page_bytes(raw: bytes, cursor_key: tuple) -> tuple[list, tuple | None, int] | None:
+    """
+    Декодирует и разбирает одну страницу ответа платформы. Чистая функция,
+    поэтому может выполняться в пуле процессов.
+    Возвращает (новые звонки, курсор страницы, сколько звонков было на странице)
+    или None, если ответ не содержит данных о звонках.
+    """
+    response_data = json_backend.loads(raw)
+    if not (response_data and response_data.get("status") == "success" and "data" in response_data.get("data", {})):
+        return None
+    calls_list = response_data["data"]["data"]
+    processed_calls, new_cursor = parse_calls(calls_list, cursor_key)
+    return processed_calls, new_cursor, len(calls_list)
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    global _parse_pool
+    if _parse_pool is None:
+        # spawn, а не fork: в процессе бота работают event loop и потоки aiohttp
+        _parse_pool = ProcessPoolExecutor(max_workers=PARSE_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _parse_pool
+
+def shutdown_parse_pool(pool: ProcessPoolExecutor | None = None):
+    """
+    Останавливает пул разбора при выходе или после падения воркера.
+    Если передан pool - останавливает только его, а не уже пересозданный пул.
+    """
+    global _parse_pool
+    if _parse_pool is not None and (pool is None or pool is _parse_pool):
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+
+async def _parse_page(raw: bytes, cursor_key: tuple):
+    """Небольшие страницы разбираем на месте, большие - в пуле процессов, чтобы не блокировать event loop."""
+    with profiler.stage("platform.parse"):
+        if PARSE_POOL_WORKERS > 0 and len(raw) >= PARSE_OFFLOAD_THRESHOLD:
+            loop = asyncio.get_running_loop()
+            pool = _get_parse_pool()
+            try:
+                return await loop.run_in_executor(pool, parse_page_bytes, raw, cursor_key)
+            except BrokenProcessPool:
+                # Воркер упал (например, по памяти) - сломанный пул отказывает во всех следующих
+                # задачах, поэтому пересоздаем его при следующем обращении, а эту страницу разбираем на месте
+                logger.error("Пул разбора страниц сломан, пересоздаем его; страница разбирается в основном процессе.")
+                shutdown_parse_pool(pool)
+        return parse_page_bytes(raw, cursor_key)
+
+async def _fetch_page(session: aiohttp.ClientSession, api_key: str, bot_id: str,
+                      start: datetime.datetime, end: datetime.datetime, page: int) -> bytes:
+    """Запрашивает одну страницу звонков за окно [start, end] и возвращает сырое тело ответа."""
     params = {
         "limit": LIMIT,
-        "page": 1,
+        "page": page,
+        # Пагинация и курсор рассчитывают на порядок по возрастанию updated_at
         "sortBy": "updated_at",
+        "sortOrder": "asc",
         "filter_date": "updated_at",
-        "date_time_start": start_date_str,
-        "date_time_end": current_date_str,
+        "date_time_start": start.isoformat(),
+        "date_time_end": end.isoformat(),
         "filter": bot_id,
         "filterOn": '["bot_id"]',
         "api_key": api_key
     }
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps(params, indent=2))
+
+    # Ограничиваем число одновременных запросов к платформе на один api_key
+    async with _semaphore_for(api_key):
+        async with session.get(BASE_URL, params=params, timeout=120) as response:
+            # Читаем тело как байты и декодируем сами, игнорируя Content-Type:
+            # сервер может отдавать JSON с text/html
+            with profiler.stage("platform.read"):
+                raw = await response.read()
+            response.raise_for_status()
+    return raw
+
+async def _fetch_window(session: aiohttp.ClientSession, api_key: str, bot_id: str,
+                        start: datetime.datetime, end: datetime.datetime,
+                        cursor_key: tuple) -> tuple[list, tuple | None, int, bool]:
+    """
+    Запрашивает и разбирает все страницы звонков за окно, пока страницы приходят полными.
+    Возвращает (новые звонки, курсор окна, сколько всего звонков получено,
+    обрезано ли окно лимитом MAX_PAGES_PER_WINDOW).
+    """
+    processed_calls, window_cursor, fetched, truncated = [], None, 0, False
+    for page in range(1, MAX_PAGES_PER_WINDOW + 1):
+        raw = await _fetch_page(session, api_key, bot_id, start, end, page)
+        parsed = await _parse_page(raw, cursor_key)
+        if parsed is None:
+            logger.warning(f"Запрос для bot_id={bot_id} успешен, но не содержит данных о звонках. "
+                           f"Ответ: {raw[:500].decode('utf-8', errors='replace')}")
+            break
+        page_calls, page_cursor, page_size = parsed
+        processed_calls.extend(page_calls)
+        window_cursor = _max_cursor(window_cursor, page_cursor)
+        fetched += page_size
+        if page_size < LIMIT:
+            break
+    else:
+        truncated = True
+        logger.warning(f"Для bot_id={bot_id} окно {start.isoformat()} - {end.isoformat()} "
+                       f"не уместилось в {MAX_PAGES_PER_WINDOW} страниц, остаток будет получен в следующем цикле.")
+    return processed_calls, window_cursor, fetched, truncated
+
+def _unique_calls(calls: list) -> list:
+    """Убирает повторы звонков по курсору (updated_at, id), а без курсора - по id."""
+    unique = {}
+    for call_data in calls:
+        unique.setdefault(call_data["cursor_key"] or call_data["call_id"], call_data)
+    return list(unique.values())
+
+def _max_cursor(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+async def get_new_calls(api_key: str, bot_id: str,
+                        scan_from: datetime.datetime) -> tuple[list, tuple | None, datetime.datetime | None]:
+    """
+    Запрашивает звонки, обновленные после scan_from (max из курсора и отметки просмотра)
+    с перекрытием CURSOR_OVERLAP. Возвращаются все звонки окна, включая перекрытие:
+    повторы отсекает вызывающий код по истории доставленных звонков.
+    Большой разрыв (после простоя или при первой активации) делится на срезы,
+    которые запрашиваются параллельно в пределах лимита на api_key.
+    Возвращает кортеж (обработанные звонки по возрастанию курсора, новый курсор или None,
+    новая отметка просмотра или None, если ее нельзя сдвигать).
+    """
+    start = scan_from - CURSOR_OVERLAP
+    end = datetime.datetime.now(datetime.timezone.utc)
+    # Отсекаем только то, что раньше окна; внутри окна решает история звонков
+    cursor_key = (start, -1)
+    windows = split_window(start, end)
     
     try:
-        logger.info(f"Отправка запроса для bot_id={bot_id}")
-        logger.debug(json.dumps(params, indent=2))
+        if len(windows) > 1:
+            logger.info(f"Для bot_id={bot_id} режим догонки: разрыв {end - start}, {len(windows)} срезов.")
+        else:
+            logger.info(f"Отправка запроса для bot_id={bot_id}")
 
         # Создаем сессию с нашими специальными заголовками
         async with aiohttp.ClientSession(headers=IMITATION_HEADERS) as session:
-            async with session.get(BASE_URL, params=params, timeout=120) as response:
-                
-                # --- ИЗМЕНЕНА ЛОГИКА ЧТЕНИЯ ОТВЕТА ---
-                # Теперь мы явно указываем, что хотим получить JSON, игнорируя Content-Type
-                # content_type=None отключает проверку mimetype, решая проблему с text/html
-                response_data = await response.json(content_type=None)
-
-                # Проверяем статус-код ПОСЛЕ попытки чтения
-                response.raise_for_status()
-
-                if response_data and response_data.get("status") == "success" and "data" in response_data.get("data", {}):
-                    calls_list = response_data["data"]["data"]
-                    logger.info(f"Для bot_id={bot_id} получено {len(calls_list)} звонков.")
-                    
-                    processed_calls = []
-                    for call in calls_list:
-                        # ... (вся логика парсинга без изменений) ...
-                        call_id = call.get('id', 'N/A')
-                        call_time = call.get('created_at', 'N/A')
-                        storage = call.get('storage')
-                        call_uuid = call.get('uuid')
-                        
-                        variables_data = call.get('variables')
-                        if not variables_data: continue
-                        variables = json.loads(variables_data) if isinstance(variables_data, str) else variables_data
-                        
-                        audio_file = variables.get('all_audio_record')
-                        
-                        if storage and call_uuid and audio_file:
-                            audio_link = f"https://client.za-bota.com/calls/storage/{storage}/{call_uuid}/{audio_file}"
-                        else:
-                            audio_link = "Ссылка недоступна"
-
-                        summarizing_data = variables.get('summarizing', {})
-                        if isinstance(summarizing_data, str) and summarizing_data:
-                           try:
-                               summarizing_obj = json.loads(summarizing_data)
-                           except json.JSONDecodeError:
-                               summarizing_obj = {"raw_text": summarizing_data}
-                        else:
-                            summarizing_obj = summarizing_data if summarizing_data else {}
-                        summarizing_pretty = json.dumps(summarizing_obj, indent=2, ensure_ascii=False)
-                        
-                        dialog = variables.get('dialog', [])
-                        transcription_text = f"Транскрибация звонка ID: {call_id}\nДата: {call_time}\n\n"
-                        for msg in dialog:
-                            if "user" in msg:
-                                transcription_text += f"Клиент: {msg['user']}\n\n"
-                            elif "assistant" in msg and ((msg['assistant'].get('state') == 'active') or (msg['assistant'].get('state') == 'last')):
-                                transcription_text += f"Ассистент: {msg['assistant'].get('message', '')}\n\n"
-
-                        processed_calls.append({
-                            "call_time": call_time,
-                            "audio_link": audio_link,
-                            "summarizing_pretty": summarizing_pretty,
-                            "transcription_text": transcription_text,
-                            "transcription_filename": f"transcription_{call_id}.txt"
-                        })
-                    return processed_calls
-                else:
-                    logger.warning(f"Запрос для bot_id={bot_id} успешен, но не содержит данных о звонках. Ответ: {response_data}")
+            # Если хотя бы один срез не получен, курсор не двигаем, чтобы не оставить дыру
+            results = await asyncio.gather(*(
+                _fetch_window(session, api_key, bot_id, window_start, window_end, cursor_key)
+                for window_start, window_end in windows
+            ), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        processed_calls, new_cursor, fetched, scanned_through = [], None, 0, end - SCAN_SAFETY_LAG
+        for window_calls, window_cursor, window_fetched, window_truncated in results:
+            processed_calls.extend(window_calls)
+            new_cursor = _max_cursor(new_cursor, window_cursor)
+            fetched += window_fetched
+            if window_truncated:
+                # Окна идут по возрастанию времени, а страницы - по возрастанию updated_at,
+                # поэтому недополученный остаток лежит после последнего полученного звонка.
+                # Более поздние окна отбрасываем, иначе курсор перепрыгнет этот остаток.
+                # Курсор ставим на начало последней отметки времени: звонки с тем же
+                # updated_at могли остаться на следующей странице, повторы отсечет история
+                if new_cursor is not None:
+                    new_cursor = (new_cursor[0], -1)
+                scanned_through = None
+                break
+        # Соседние срезы делят границу, и звонок с updated_at ровно на ней приходит дважды
+        processed_calls = _unique_calls(processed_calls)
+        # Курсор двигается по порядку updated_at, поэтому и отправляем в этом порядке
+        processed_calls.sort(key=lambda c: c["cursor_key"] or cursor_key)
+        logger.info(f"Для bot_id={bot_id} получено {fetched} звонков, с данными: {len(processed_calls)}.")
+        return processed_calls, new_cursor, scanned_through
         
     except aiohttp.ClientResponseError as e:
         logger.error(f"Ошибка HTTP от API для bot_id={bot_id}. Статус: {e.status}. Сообщение: {e.message}")
     except aiohttp.ClientError as e:
         logger.error(f"Сетевая ошибка при запросе к API для bot_id={bot_id}: {e}")
-    except json.JSONDecodeError:
+    except json_backend.JSONDecodeError:
         logger.error(f"Не удалось прочитать JSON из ответа сервера для bot_id={bot_id}.")
     except Exception as e:
         logger.exception(f"Непредвиденная ошибка при обработке звонков для bot_id={bot_id}:")
     
-    return []
\ No newline at end of file
+    return [], None, None
\ No newline at end of file
@@ -0,0 +1,117 @@
+# profiling.py
+import cProfile
+import io
+import logging
+import pstats
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Сколько функций и тенантов попадает в отчет
+TOP_FUNCTIONS = 30
+TOP_TENANTS = 10
+
+class CycleProfiler:
+    """
+    Профилирует следующие N циклов планировщика: cProfile по функциям,
+    время ожидания по этапам (БД, API платформы, Telegram) и время по тенантам.
+    Пока профилировщик не взведен, stage() и tenant() почти ничего не стоят.
+    """
+    def __init__(self):
+        self.remaining = 0
+        self.requested_by = None # chat_id администратора или None - отчет всем администраторам
+        self._profile = None
+        self._running = False
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._stage_times = defaultdict(float)
+        self._stage_counts = defaultdict(int)
+        self._tenant_times = defaultdict(float)
+        self._cycle_times = []
+        self._cycle_started = 0.0
+
+    def arm(self, cycles: int, requested_by: int | None = None):
+        # Повторный запуск во время цикла: текущий цикл в новый отчет не попадает
+        if self._running:
+            self._profile.disable()
+            self._running = False
+        self.remaining = cycles
+        self.requested_by = requested_by
+        self._profile = cProfile.Profile()
+        self._reset_stats()
+        logger.info(f"Профилирование включено на {cycles} циклов планировщика.")
+
+    def begin_cycle(self):
+        if self.remaining <= 0:
+            return
+        self._running = True
+        self._cycle_started = time.perf_counter()
+        self._profile.enable()
+
+    def end_cycle(self) -> bytes | None:
+        """Завершает цикл. Если это был последний профилируемый цикл - возвращает отчет."""
+        if not self._running:
+            return None
+        self._profile.disable()
+        self._running = False
+        self._cycle_times.append(time.perf_counter() - self._cycle_started)
+        self.remaining -= 1
+        if self.remaining > 0:
+            return None
+        report = self._build_report()
+        self._profile = None
+        return report
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self._running:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stage_times[name] += time.perf_counter() - started
+            self._stage_counts[name] += 1
+
+    @contextmanager
+    def tenant(self, tenant_id: str):
+        if not self._running:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._tenant_times[tenant_id] += time.perf_counter() - started
+
+    def _build_report(self) -> bytes:
+        out = io.StringIO()
+        total = sum(self._cycle_times)
+        out.write(f"Профиль циклов планировщика: {len(self._cycle_times)} цикл(ов), всего {total:.3f} с\n")
+        out.write("Длительность циклов: " + ", ".join(f"{t:.3f} с" for t in self._cycle_times) + "\n")
+        out.write("cProfile учитывает и обработчики, работавшие в event loop во время цикла.\n\n")
+
+        out.write("=== Ожидание по этапам ===\n")
+        out.write(f"{'этап':<28}{'всего, с':>12}{'вызовов':>10}{'среднее, мс':>14}\n")
+        for name, spent in sorted(self._stage_times.items(), key=lambda item: item[1], reverse=True):
+            count = self._stage_counts[name]
+            out.write(f"{name:<28}{spent:>12.3f}{count:>10}{spent / count * 1000:>14.1f}\n")
+
+        out.write(f"\n=== Самые медленные тенанты (bot_id), топ-{TOP_TENANTS} ===\n")
+        slowest = sorted(self._tenant_times.items(), key=lambda item: item[1], reverse=True)[:TOP_TENANTS]
+        for tenant_id, spent in slowest:
+            out.write(f"{tenant_id:<40}{spent:>10.3f} с\n")
+
+        stats = pstats.Stats(self._profile, stream=out)
+        stats.strip_dirs()
+        out.write(f"\n=== Функции по суммарному времени (cumulative), топ-{TOP_FUNCTIONS} ===\n")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+        out.write(f"\n=== Функции по собственному времени (tottime), топ-{TOP_FUNCTIONS} ===\n")
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(TOP_FUNCTIONS)
+        return out.getvalue().encode('utf-8')
+
+profiler = CycleProfiler()
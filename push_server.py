@@ -0,0 +1,94 @@
+# push_server.py
+import asyncio
+import hashlib
+import hmac
+import logging
+
+from aiogram import Bot
+from aiohttp import web
+
+import json_backend
+from config import PUSH_SECRET, PUSH_HOST, PUSH_PORT
+from database.config_snapshot import config_snapshot
+from scheduler import deliver_pushed_call
+
+logger = logging.getLogger(__name__)
+
+EVENT_PATH = "/events/call-completed"
+# HMAC-SHA256 тела запроса в hex (допускается префикс "sha256=")
+SIGNATURE_HEADER = "X-Signature"
+# Альтернатива подписи для простых интеграций: сам секрет в заголовке
+SECRET_HEADER = "X-Push-Secret"
+MAX_BODY_SIZE = 5 * 1024 * 1024
+
+_delivery_tasks = set()
+
+def _header_bytes(value: str) -> bytes:
+    # compare_digest не принимает строки с не-ASCII символами, поэтому сравниваем байты
+    return value.encode('utf-8', errors='replace')
+
+def is_authorized(body: bytes, headers) -> bool:
+    """Проверяет HMAC-подпись тела или, если подписи нет, общий секрет в заголовке."""
+    signature = headers.get(SIGNATURE_HEADER)
+    if signature:
+        expected = hmac.new(PUSH_SECRET.encode('utf-8'), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(_header_bytes(signature.removeprefix("sha256=")), expected.encode('ascii'))
+    secret = headers.get(SECRET_HEADER)
+    return bool(secret) and hmac.compare_digest(_header_bytes(secret), PUSH_SECRET.encode('utf-8'))
+
+def _event_field(call: dict, event: dict, name: str) -> str | None:
+    value = call.get(name, event.get(name))
+    return str(value) if value not in (None, "") else None
+
+async def handle_call_completed(request: web.Request) -> web.Response:
+    body = await request.read()
+    if not is_authorized(body, request.headers):
+        logger.warning(f"Push-событие с неверной подписью от {request.remote}.")
+        return web.json_response({"status": "unauthorized"}, status=401)
+
+    try:
+        event = json_backend.loads(body)
+    except json_backend.JSONDecodeError:
+        return web.json_response({"status": "invalid json"}, status=400)
+
+    # Платформа может прислать звонок как есть или обернутым в {"call": {...}}
+    call = event.get("call", event) if isinstance(event, dict) else None
+    if not isinstance(call, dict):
+        return web.json_response({"status": "invalid event"}, status=400)
+    bot_id = _event_field(call, event, "bot_id")
+    if not bot_id:
+        return web.json_response({"status": "bot_id is required"}, status=400)
+
+    # Конфигурацию ищем так же, как find_user_by_config: bot_id + trunk_id + api_key,
+    # если платформа прислала эти поля
+    trunk_id = _event_field(call, event, "trunk_id")
+    configs = await config_snapshot.find_configs(bot_id, trunk_id, _event_field(call, event, "api_key"))
+    if not configs:
+        logger.info(f"Push-событие для неизвестной конфигурации bot_id={bot_id}, trunk_id={trunk_id} проигнорировано.")
+        return web.json_response({"status": "unknown config"}, status=404)
+
+    # Отвечаем сразу, а разбор и отправку делаем в фоне, чтобы платформа не ждала Telegram
+    bot = request.app["bot"]
+    for config in configs:
+        task = asyncio.create_task(_deliver(bot, config, call))
+        _delivery_tasks.add(task)
+        task.add_done_callback(_delivery_tasks.discard)
+    logger.info(f"Принято push-событие для bot_id={bot_id} ({len(configs)} конфигураций).")
+    return web.json_response({"status": "accepted"}, status=202)
+
+async def _deliver(bot: Bot, config, call: dict):
+    try:
+        await deliver_pushed_call(bot, config, call)
+    except Exception:
+        logger.exception(f"Не удалось доставить push-событие для bot_id={config.bot_id}:")
+
+async def start_push_server(bot: Bot) -> web.AppRunner:
+    """Поднимает локальный HTTP-сервер для push-событий платформы."""
+    app = web.Application(client_max_size=MAX_BODY_SIZE)
+    app["bot"] = bot
+    app.router.add_post(EVENT_PATH, handle_call_completed)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, PUSH_HOST, PUSH_PORT).start()
+    logger.info(f"Push-endpoint запущен на http://{PUSH_HOST}:{PUSH_PORT}{EVENT_PATH}")
+    return runner
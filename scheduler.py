@@ -1,73 +1,350 @@
 # scheduler.py
+import asyncio
 import logging
 import datetime
 from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
 from aiogram.types import BufferedInputFile
 
-from database.requests import get_all_active_configs, update_config_check_time, get_active_template
-from platform_api import get_new_calls
+from database.requests import record_calls, get_recorded_call_ids
+from database.fast_path import update_config_check_time, fetch_active_template_text
+from database.config_snapshot import config_snapshot
+from platform_api import get_new_calls, parse_calls, CATCHUP_THRESHOLD
+from attachments import build_call_notification, make_document, upload_counter
+from profiling import profiler
+from config import ADMIN_IDS
 
 logger = logging.getLogger(__name__)
 
+# --- Доставка звонков, накопившихся за время простоя ---
+# Звонки, обновленные раньше этого окна, считаются накопившимися
+FRESH_WINDOW = datetime.timedelta(minutes=15)
+# Если накопившихся звонков больше - отправляем одну сводку вместо отдельных уведомлений
+CATCHUP_DIGEST_THRESHOLD = 20
+# Пауза между уведомлениями при фоновой досылке, в секундах
+CATCHUP_SEND_INTERVAL = 3
+# Сколько досылок может идти одновременно
+_backlog_drains = asyncio.Semaphore(5)
+_backlog_tasks = set()
+# Звонки, которые еще ждут фоновой досылки: config_id -> {id звонка: курсор звонка}.
+# Пока звонок здесь, курсор конфигурации не уходит дальше него, так что после
+# перезапуска бота опрос получит его снова
+_in_flight: dict[int, dict[int, tuple]] = {}
+
+# --- Итог отправки уведомления ---
+SENT = "sent"
+# Временная ошибка Telegram или сети: курсор не уходит дальше звонка, и следующий опрос отправит его снова
+RETRY = "retry"
+# Повтор не поможет (бот заблокирован, ошибка в шаблоне) - звонок пропускается
+FAILED = "failed"
+TRANSIENT_SEND_ERRORS = (TelegramRetryAfter, TelegramNetworkError, TelegramServerError, asyncio.TimeoutError)
+# Звонки старше этого больше не повторяем, чтобы курсор не стоял на месте вечно
+RETRY_GIVE_UP_AFTER = datetime.timedelta(days=1)
+
+# Push-события разбираются без отсечения по курсору - повторы отсекает история звонков
+PUSH_CURSOR_FLOOR = (datetime.datetime.min.replace(tzinfo=datetime.timezone.utc), -1)
+
+async def _send_call(bot: Bot, telegram_id: int, template_text: str, call_data: dict) -> str:
+    """Отправляет уведомление об одном звонке с транскрибацией во вложении. Возвращает SENT, RETRY или FAILED."""
+    try:
+        # Подпись укладывается в лимит Telegram, большие транскрибации уходят архивом
+        message_text, parse_mode, transcription_file = build_call_notification(template_text, call_data)
+
+        with profiler.stage("telegram.send_document"):
+            await bot.send_document(
+                chat_id=telegram_id,
+                document=transcription_file.file,
+                caption=message_text,
+                parse_mode=parse_mode
+            )
+        upload_counter.add(transcription_file)
+        logger.info(f"Отправлено уведомление пользователю {telegram_id} по звонку.")
+        return SENT
+    except KeyError as e:
+        # Эта ошибка сработает, если в шаблоне опечатка
+        logger.error(f"Ошибка форматирования шаблона для пользователя {telegram_id}. Отсутствует ключ: {e}")
+    except TRANSIENT_SEND_ERRORS as e:
+        logger.warning(f"Временная ошибка при отправке уведомления пользователю {telegram_id}, повторим при следующем опросе: {e}")
+        return RETRY
+    except Exception as e:
+        logger.exception(f"Не удалось отправить уведомление пользователю {telegram_id}:")
+    return FAILED
+
+def _split_backlog(calls: list) -> tuple[list, list]:
+    """Делит звонки на свежие и накопившиеся (обновлены раньше FRESH_WINDOW назад)."""
+    fresh_since = datetime.datetime.now(datetime.timezone.utc) - FRESH_WINDOW
+    fresh, backlog = [], []
+    for call_data in calls:
+        call_key = call_data.get('cursor_key')
+        if call_key is not None and call_key[0] < fresh_since:
+            backlog.append(call_data)
+        else:
+            fresh.append(call_data)
+    return fresh, backlog
+
+async def _send_backlog_digest(bot: Bot, telegram_id: int, calls: list) -> str:
+    """Вместо множества уведомлений отправляет одну сводку со всеми транскрибациями в файле. Возвращает SENT, RETRY или FAILED."""
+    parts = []
+    for call_data in calls:
+        parts.append(
+            f"{'=' * 40}\n"
+            f"Запись: {call_data['audio_link']}\n"
+            f"Результат:\n{call_data['summarizing_pretty']}\n\n"
+            f"{call_data['transcription_text']}"
+        )
+    caption = (
+        "<b>📦 Накопившиеся звонки</b>\n\n"
+        f"Пока уведомления не отправлялись, поступило звонков: <b>{len(calls)}</b>\n"
+        f"Период: с <code>{calls[0]['call_time']}</code> по <code>{calls[-1]['call_time']}</code>\n\n"
+        "Результаты и транскрибации всех звонков - во вложенном файле. Статистика: /stats"
+    )
+    document = make_document("\n".join(parts), "backlog_calls.txt")
+    try:
+        with profiler.stage("telegram.send_document"):
+            await bot.send_document(
+                chat_id=telegram_id,
+                document=document.file,
+                caption=caption,
+                parse_mode="HTML"
+            )
+        upload_counter.add(document)
+        logger.info(f"Пользователю {telegram_id} отправлена сводка по {len(calls)} накопившимся звонкам.")
+        return SENT
+    except TRANSIENT_SEND_ERRORS as e:
+        logger.warning(f"Временная ошибка при отправке сводки пользователю {telegram_id}, повторим при следующем опросе: {e}")
+        return RETRY
+    except Exception:
+        logger.exception(f"Не удалось отправить сводку накопившихся звонков пользователю {telegram_id}:")
+    return FAILED
+
+async def _drain_backlog(bot: Bot, config, template_text: str, calls: list):
+    in_flight = _in_flight.setdefault(config.config_id, {})
+    try:
+        async with _backlog_drains:
+            logger.info(f"Досылка {len(calls)} накопившихся звонков пользователю {config.telegram_id}.")
+            for call_data in calls:
+                if await _send_call(bot, config.telegram_id, template_text, call_data) == SENT:
+                    await _record_delivered(config, [call_data])
+                # Неотправленный звонок опрос получит снова: курсор удерживался на нем
+                _release_in_flight(config, [call_data])
+                await asyncio.sleep(CATCHUP_SEND_INTERVAL)
+    finally:
+        _release_in_flight(config, calls)
+        if not in_flight:
+            _in_flight.pop(config.config_id, None)
+
+def _release_in_flight(config, calls: list):
+    in_flight = _in_flight.get(config.config_id, {})
+    for call_data in calls:
+        if call_data['cursor_key'] is not None:
+            in_flight.pop(call_data['cursor_key'][1], None)
+
+def _start_backlog_drain(bot: Bot, config, template_text: str, calls: list):
+    """Запускает фоновую досылку накопившихся звонков с ограниченной скоростью."""
+    # Регистрируем звонки до сохранения курсора, чтобы он не ушел дальше них
+    in_flight = _in_flight.setdefault(config.config_id, {})
+    for call_data in calls:
+        if call_data['cursor_key'] is not None:
+            in_flight[call_data['cursor_key'][1]] = call_data['cursor_key']
+    task = asyncio.create_task(_drain_backlog(bot, config, template_text, calls))
+    _backlog_tasks.add(task)
+    task.add_done_callback(_backlog_tasks.discard)
+
+async def _filter_undelivered(config, calls: list) -> list:
+    """
+    Отбрасывает звонки, которые уже есть в истории или ждут фоновой досылки.
+    Так звонок, доставленный push-событием, не отправляется повторно при опросе, и наоборот.
+    """
+    in_flight = _in_flight.get(config.config_id, {})
+    calls = [call for call in calls if call['cursor_key'] is None or call['cursor_key'][1] not in in_flight]
+    call_ids = [call['cursor_key'][1] for call in calls if call['cursor_key'] is not None]
+    try:
+        with profiler.stage("db.recorded_calls"):
+            delivered_ids = await get_recorded_call_ids(config.config_id, call_ids)
+    except Exception:
+        # Лучше возможный повтор, чем потерянное уведомление
+        logger.exception(f"Не удалось проверить историю звонков для bot_id={config.bot_id}:")
+        return calls
+    return [call for call in calls if call['cursor_key'] is None or call['cursor_key'][1] not in delivered_ids]
+
+async def _record_delivered(config, calls: list):
+    """
+    Сохраняет в историю (для /stats и отсева повторов) только отправленные звонки.
+    Звонок, не отправленный из-за временной ошибки, в историю не попадает: при опросе
+    курсор не уходит дальше него (см. _hold_progress), а push-событие подхватит сверка.
+    """
+    if not calls:
+        return
+    try:
+        with profiler.stage("db.record_calls"):
+            await record_calls(config.config_id, calls)
+    except Exception:
+        logger.exception(f"Не удалось сохранить историю звонков для bot_id={config.bot_id}:")
+
+async def _send_calls(bot: Bot, config, template_text: str, calls: list) -> list:
+    """
+    Отправляет уведомления по очереди и сохраняет в историю те, что дошли.
+    Возвращает звонки, которые стоит повторить (временные ошибки).
+    """
+    delivered, retry = [], []
+    for call_data in calls:
+        status = await _send_call(bot, config.telegram_id, template_text, call_data)
+        if status == SENT:
+            delivered.append(call_data)
+        elif status == RETRY:
+            retry.append(call_data)
+    await _record_delivered(config, delivered)
+    return retry
+
+def _hold_progress(config, pending: list, new_cursor, scanned_through):
+    """
+    Не дает курсору и отметке просмотра уйти дальше самого раннего недоставленного звонка,
+    включая звонки, которые еще ждут фоновой досылки.
+    Следующее окно начнется с max(курсор, отметка) минус перекрытие и снова его получит,
+    а уже доставленные звонки отсеет история.
+    """
+    give_up_since = datetime.datetime.now(datetime.timezone.utc) - RETRY_GIVE_UP_AFTER
+    held = [call['cursor_key'] for call in pending if call['cursor_key'] is not None and call['cursor_key'][0] >= give_up_since]
+    if len(held) < len(pending):
+        logger.warning(f"Для bot_id={config.bot_id} {len(pending) - len(held)} звонков не будут повторены: "
+                       f"нет отметки времени или они старше {RETRY_GIVE_UP_AFTER}.")
+    # Звонки фоновой досылки держат курсор, пока не отправлены
+    held.extend(_in_flight.get(config.config_id, {}).values())
+    if not held:
+        return new_cursor, scanned_through
+    oldest = min(held)[0]
+    if new_cursor is not None and new_cursor[0] > oldest:
+        new_cursor = (oldest, -1)
+    if scanned_through is not None and scanned_through > oldest:
+        scanned_through = oldest
+    return new_cursor, scanned_through
+
+async def deliver_pushed_call(bot: Bot, config, call: dict):
+    """Доставляет звонок из push-события тем же путем разбора и отправки, что и при опросе."""
+    template_text = await fetch_active_template_text()
+    if not template_text:
+        logger.warning(f"Push-событие для bot_id={config.bot_id} пропущено: нет активного шаблона.")
+        return
+    processed_calls, _ = parse_calls([call], PUSH_CURSOR_FLOOR)
+    if not processed_calls:
+        logger.info(f"Push-событие для bot_id={config.bot_id} не содержит данных звонка.")
+        return
+    await _send_calls(bot, config, template_text, await _filter_undelivered(config, processed_calls))
+
+async def _save_check(config, check_time: datetime.datetime, new_cursor, scanned_through):
+    """Сохраняет отметку проверки, курсор и отметку просмотра в БД и в снимке конфигураций."""
+    # Окно начинается раньше курсора, поэтому его максимум может оказаться позади - назад не двигаем
+    if new_cursor is not None and config.cursor_key() is not None and new_cursor <= config.cursor_key():
+        new_cursor = None
+    if scanned_through is not None and config.scanned_through is not None and scanned_through <= config.scanned_through:
+        scanned_through = None
+    await update_config_check_time(config.config_id, check_time, new_cursor, scanned_through)
+    config_snapshot.record_check(config, check_time, new_cursor, scanned_through)
+
+async def _send_profile_report(bot: Bot, report: bytes):
+    """Отправляет отчет профилировщика администратору, который его запросил, или всем администраторам."""
+    recipients = [profiler.requested_by] if profiler.requested_by else ADMIN_IDS
+    filename = f"scheduler_profile_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    for admin_id in recipients:
+        try:
+            await bot.send_document(
+                chat_id=admin_id,
+                document=BufferedInputFile(file=report, filename=filename),
+                caption="📈 Профиль циклов планировщика"
+            )
+        except Exception:
+            logger.exception(f"Не удалось отправить отчет профилировщика администратору {admin_id}:")
+
 async def check_new_calls_and_notify(bot: Bot):
+    profiler.begin_cycle()
+    try:
+        await _run_cycle(bot)
+    finally:
+        report = profiler.end_cycle()
+        if report:
+            await _send_profile_report(bot, report)
+
+async def _run_cycle(bot: Bot):
     logger.info("Планировщик: Начало проверки новых звонков...")
+    uploads_before = upload_counter.totals()
     
-    # Получаем все конфигурации из БД
-    configs = await get_all_active_configs()
-    template_obj = await get_active_template()
+    # Конфигурации берем из снимка в памяти, он обновляется по NOTIFY из БД
+    with profiler.stage("db.configs"):
+        configs_by_api_key = await config_snapshot.get()
+    with profiler.stage("db.template"):
+        template_text = await fetch_active_template_text()
 
-    if not template_obj:
+    if not template_text:
         logger.warning("Планировщик: Нет активного шаблона, проверка отменена.")
         return
 
-    template_text = template_obj.template_text
-
+    configs = [config for api_configs in configs_by_api_key.values() for config in api_configs]
+    # Конфигурации, которым нужна догонка, опрашиваем последними, чтобы их долгие
+    # запросы не задерживали свежие уведомления остальных пользователей.
+    # Разрыв считаем от отметки просмотра: у тихой конфигурации курсор стоит на месте
+    catchup_since = datetime.datetime.now(datetime.timezone.utc) - CATCHUP_THRESHOLD
+    configs.sort(key=lambda config: config.scan_from() is None or config.scan_from() < catchup_since)
     for config in configs:
-        telegram_id, api_key, bot_id, last_checked_at = config
-        
-        # Если это первая проверка, берем звонки за последний час
-        if last_checked_at is None:
-            last_checked_at = datetime.datetime.now() - datetime.timedelta(days=1)
+        with profiler.tenant(config.bot_id):
+            await _process_config(bot, config, template_text)
         
-        current_check_time = datetime.datetime.now()
-        
-        # Получаем новые звонки с платформы
-        new_calls = await get_new_calls(api_key, bot_id, last_checked_at)
-        
-        if not new_calls:
-            # Обновляем время, даже если звонков нет, чтобы не проверять одно и то же
-            await update_config_check_time(api_key, bot_id, current_check_time)
-            continue
-
-        # Отправляем уведомления по каждому новому звонку
-        for call_data in new_calls:
-            try:
-                # Используем ПРАВИЛЬНЫЕ имена переменных
-                message_text = template_text.format(
-                call_time=call_data['call_time'],
-                audio_link=call_data['audio_link'],
-                summarizing_pretty=call_data['summarizing_pretty']
-                )
+    # Разница за время цикла включает и фоновые досылки и push-события, завершившиеся за это время
+    files, compressed, raw_bytes, uploaded_bytes = (
+        total - before for total, before in zip(upload_counter.totals(), uploads_before)
+    )
+    if files:
+        logger.info(f"Планировщик: за цикл отправлено вложений {files} ({compressed} в архиве), "
+                    f"{uploaded_bytes / 1024:.1f} КБ из {raw_bytes / 1024:.1f} КБ исходного текста; "
+                    f"с момента запуска - {upload_counter.files} файлов, {upload_counter.uploaded_bytes / 1024:.1f} КБ.")
+    logger.info("Планировщик: Проверка новых звонков завершена.")
+
+async def _process_config(bot: Bot, config, template_text: str):
+    """Опрашивает платформу по одной конфигурации и рассылает уведомления о новых звонках."""
+    telegram_id, api_key, bot_id = config.telegram_id, config.api_key, config.bot_id
+
+    # Курсор и отметка просмотра - это время платформы, а не наши часы
+    scan_from = config.scan_from()
+    if scan_from is None:
+        if config.last_checked_at is not None:
+            # Конфигурация опрашивалась до появления курсора: продолжаем с той же отметки
+            scan_from = config.last_checked_at.astimezone(datetime.timezone.utc)
+        else:
+            # Если это первая проверка, берем звонки за последние сутки
+            scan_from = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1)
     
-                transcription_file = BufferedInputFile(
-                file=call_data['transcription_text'].encode('utf-8'),
-                filename=call_data['transcription_filename']
-                )
-
-                await bot.send_document(
-                    chat_id=telegram_id,
-                    document=transcription_file,
-                    caption=message_text,
-                    parse_mode="HTML"
-                )
-                logger.info(f"Отправлено уведомление пользователю {telegram_id} по звонку.")
-            except KeyError as e:
-                # Эта ошибка сработает, если в шаблоне опечатка
-                logger.error(f"Ошибка форматирования шаблона для пользователя {telegram_id}. Отсутствует ключ: {e}")
-            except Exception as e:
-                logger.exception(f"Не удалось отправить уведомление пользователю {telegram_id}:")
-        
-        # Обновляем время последней проверки
-        await update_config_check_time(api_key, bot_id, current_check_time)
-        
-    logger.info("Планировщик: Проверка новых звонков завершена.")
\ No newline at end of file
+    current_check_time = datetime.datetime.now()
+    
+    # Получаем новые звонки с платформы
+    with profiler.stage("platform.get_new_calls"):
+        new_calls, new_cursor, scanned_through = await get_new_calls(api_key, bot_id, scan_from)
+
+    if new_calls:
+        new_calls = await _filter_undelivered(config, new_calls)
+    
+    if not new_calls:
+        # Отмечаем проверку; курсор двигаем, только если платформа вернула что-то новое,
+        # а отметку просмотра - после любого успешного запроса. Звонки фоновой досылки держат оба
+        new_cursor, scanned_through = _hold_progress(config, [], new_cursor, scanned_through)
+        with profiler.stage("db.update_check"):
+            await _save_check(config, current_check_time, new_cursor, scanned_through)
+        return
+
+    # Свежие звонки отправляем сразу, а накопившиеся за время простоя - отдельно,
+    # чтобы догонка не задерживала живые уведомления
+    fresh_calls, backlog_calls = _split_backlog(new_calls)
+    pending = await _send_calls(bot, config, template_text, fresh_calls)
+
+    if backlog_calls:
+        if len(backlog_calls) > CATCHUP_DIGEST_THRESHOLD:
+            status = await _send_backlog_digest(bot, telegram_id, backlog_calls)
+            if status == SENT:
+                await _record_delivered(config, backlog_calls)
+            elif status == RETRY:
+                pending.extend(backlog_calls)
+        else:
+            _start_backlog_drain(bot, config, template_text, backlog_calls)
+    
+    # Обновляем время последней проверки и сдвигаем курсор, но не дальше недоставленных звонков
+    new_cursor, scanned_through = _hold_progress(config, pending, new_cursor, scanned_through)
+    with profiler.stage("db.update_check"):
+        await _save_check(config, current_check_time, new_cursor, scanned_through)
\ No newline at end of file